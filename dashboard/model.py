@@ -32,10 +32,6 @@ class Model:
 
         return res
 
-    @classmethod
-    def get_res_sim_matrix(cls, payload):
-        return cls._using_cache(cls._get_res_sim_matrix, payload, relevant=[KW])
-
     @classmethod
     def get_res_df(cls, payload):
         return cls._using_cache(cls._get_res_df, payload, relevant=[KW])
@@ -54,12 +50,6 @@ class Model:
 
     # --- functions -----------------------------------------------------------
 
-    @classmethod
-    def _get_res_sim_matrix(cls, payload):
-        res_df = cls.get_res_df(payload)
-        cs_only = payload[CS_ONLY] if CS_ONLY in payload else False
-        return cls._compute_sim_matrix(res_df, cs_only)
-
     @classmethod
     def _get_res_df(cls, payload):
         df = cls.base_df[cls.base_df['all_text'].str.contains(payload[KW], na=False, case=False)]
@@ -75,22 +65,13 @@ class Model:
         selected_res_index = payload[SELECTED_RES_INDEX]
         cs_only = payload[CS_ONLY] if CS_ONLY in payload else False
 
-        sim_matrix = cls.get_res_sim_matrix(payload)
-
-        df['similarity'] = sim_matrix[selected_res_index]
-        df['color'] = df['survey_id'].apply(lambda si: 'green' if si == df.iloc[selected_res_index]['survey_id'] else 'red')
+        selected_survey_id = df.iloc[selected_res_index]['survey_id']
 
-        df = df.drop(df.index[selected_res_index])
-
-        if cs_only:
-            df = df[df['color'] == 'red']
-
-        df = df.sort_values(by='similarity', ascending=False)
+        df = cls.sim.get_top_k(df, selected_res_index, k=MAX_BARS, cs_only=cs_only)
+        df['color'] = np.where(df['survey_id'] == selected_survey_id, 'green', 'red')
 
         df['index'] = range(len(df))
 
-        df = df.iloc[:MAX_BARS]
-
         return df
 
     @classmethod
@@ -134,18 +115,24 @@ class Model:
 
     @classmethod
     def _create_comp_df(cls, qx, qy):
-        col2doc_sim = [(c, cls.sim.get_text_sim) for c in ANALYSED_COLS + ['survey_name']]
+        col2sim = [(c, cls.sim) for c in ANALYSED_COLS + ['survey_name']]
         exact_sim = ExactSim()
-        col2doc_sim.extend([(c, exact_sim.get_text_sim) for c in ['survey_id', 'form_type', 'tr_code']])
+        col2sim.extend([(c, exact_sim) for c in ['survey_id', 'form_type', 'tr_code']])
 
-        df = simeval.create_comp_df(qx, qy, DISPLAYED_COLS, dict(col2doc_sim))
+        df = simeval.create_comp_df(qx, qy, DISPLAYED_COLS, dict(col2sim))
 
         return df
 
     @classmethod
     def init(cls):
         try:
-            cls.base_df = load_clean_df()
+            fpath = CLEAN_LIGHT_FPATH
+            cls.base_df = load_clean_df(fpath=fpath)
         except:
             fpath = BUNDLED_DATA_DIR + '/clean-light.csv'
             cls.base_df = load_clean_df(fpath=fpath)
+
+        try:
+            cls.sim = TfidfCosSim(use_precomputed_index=True, data_hash=get_file_hash(fpath))
+        except (IOError, OSError):
+            pass  # no TF-IDF index generated - stick to fitting the TF-IDF model on the fly
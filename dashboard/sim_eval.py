@@ -50,6 +50,8 @@ SIM_PARAMS_CHECKOPTS = [SIM_PARAM_REM_STOP, SIM_PARAM_STEM, SIM_PARAM_ONLY_ALPHA
 
 SAMPLE_SIZE_LABEL = 'Sample size (sampling from search results)'
 
+JARO_MAX_SAMPLE_SIZE = 1000
+
 class SimEvalApp:
     def update_chart(self, holding_div, create_chart_code_method):
         holding_div.text = 'Updating...'
@@ -74,8 +76,16 @@ class SimEvalApp:
         if WV_DICT_MODEL_PARAM in sig_args:
             sim_params[WV_DICT_MODEL_PARAM] = [e for e in qsim.W2vModelName][self.wv_dict_model_ctrl.active]
 
+        # use precomputed question embeddings of the loaded data, if the sim supports them
+        if 'data_hash' in sig_args:
+            sim_params['data_hash'] = self.data_hash
+
         sim = sim_class(cols=cols, **sim_params)
 
+        # apply the model fitted on the loaded data offline (see generate_pickles), if there is one
+        if sim.has_saved_model(data_hash=self.data_hash):
+            sim.load()
+
         return sim
 
     def update(self):
@@ -106,7 +116,7 @@ class SimEvalApp:
         spectrum_sample = self.spectrum_spectrum_sample_size_ctrl.value
 
         # restrict sample size in Jaro case, as its computationally intensive
-        max_sample_size = 200 if sim_class == JaroSim else len(self.base_df)
+        max_sample_size = JARO_MAX_SAMPLE_SIZE if sim_class == JaroSim else len(self.base_df)
         bc_sample_size = min(max_sample_size, bc_sample_size)
         hist_sample_size = min(max_sample_size, hist_sample_size)
         spectrum_sample = min(max_sample_size, spectrum_sample)
@@ -118,25 +128,23 @@ class SimEvalApp:
         # --- Top results -----------------------------------------------------------
 
         def create_sim_input_div():
-            rows = []
+            # with an ANN index, the whole question bank is searched - not just a sample of the search results
+            if hasattr(sim, 'has_ann_index') and sim.has_ann_index():
+                sims = sim.search_question_bank(sim_input_text, k=sim_input_nres)
+
+                res_df = self.base_df.loc[sims.index].reindex(columns=cols)
+                res_df['similarity'] = sims.values
+
+                return simeval.get_df_html_with_similarities_colored(res_df, similarity_col='similarity')
 
             sdf = df.copy()
             if len(sdf) > sim_input_sample_size:
                 sdf = sdf.sample(sim_input_sample_size)
 
-            for _, row in sdf.iterrows():
-                row_text = sim.preprocess_question(row)
-                similarity = sim.get_text_sim(row_text, sim_input_text)
-                if similarity is None:
-                    similarity = 0
-
-                rows.append((row, similarity))
+            sdf['similarity'] = np.nan_to_num(sim.score_text_against(sdf, sim_input_text))
 
-            rows.sort(key=lambda x: x[1], reverse=True)
-            for r in rows:
-                r[0]['similarity'] = r[1]
-
-            res_df = pd.DataFrame([r[0] for r in rows[:sim_input_nres]], columns=cols + ['similarity'])
+            res_df = sdf.sort_values('similarity', ascending=False, kind='stable').iloc[:sim_input_nres]
+            res_df = res_df.reindex(columns=cols + ['similarity'])
 
             html = simeval.get_df_html_with_similarities_colored(res_df, similarity_col='similarity')
 
@@ -235,10 +243,12 @@ class SimEvalApp:
         pd.set_option('display.max_colwidth', -1)
 
         try:
-            self.base_df = load_clean_df()
+            fpath = CLEAN_LIGHT_FPATH
+            self.base_df = load_clean_df(fpath=fpath)
         except:
             fpath = BUNDLED_DATA_DIR + '/clean-light.csv'
             self.base_df = load_clean_df(fpath=fpath)
+        self.data_hash = get_file_hash(fpath)
         self.base_df[SEARCH_FIELD] = self.base_df.apply(lambda row: ' '.join(str(x).lower() for x in row[SEARCH_COLS] if pd.notnull(x)), axis=1)
 
         # divs holding the charts
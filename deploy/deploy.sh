@@ -5,6 +5,7 @@ source "$cur_dir/deploy-common.sh"
 
 # copy in some data to bundle with the app -----------------------------------
 cp -r $CHECKPOINTS_DIR/*.pkl "$cur_dir/../dashboard/bundled_data/"
+cp -r $CHECKPOINTS_DIR/*.npy "$cur_dir/../dashboard/bundled_data/"
 cp -r $CLEAN_LIGHT_FPATH "$cur_dir/../dashboard/bundled_data/"
 
 cp -r "$cur_dir/../dashboard" "$DEPLOY_ROOT/"
@@ -1,3 +1,4 @@
+import datetime
 import io
 
 import json_to_df.dataframing as dataframing
@@ -36,33 +37,108 @@ def json2df(json_fpath, problems=[], print_debug=True, save_csv=False):
     return df
 
 
-def create_full_df(print_debug=True):
+SEP_LEN = 100
+
+
+def _json2df_or_none(json_fpath, print_debug=True):
+    """Like json2df, but failures are only reported and None returned"""
     def _print(s=''):
         if print_debug:
             print(s)
 
-    SEP_LEN = 100
+    try:
+        problems = []
+        df = json2df(json_fpath, problems, print_debug=print_debug)
+
+        if len(problems) != 0:
+            _print('PROBLEMS: {}'.format(', '.join([p[0] for p in problems])))
+    except json.JSONDecodeError as e:
+        _print('JSON decode ERROR: {}'.format(e))
+        return None
+    except Exception as e:
+        _print('ERROR: {}'.format(e))
+        return None
+
+    return df
+
+
+def _save_clean_dfs(cdf):
+    cdf = gh.reorder_cols(cdf, first_cols=FIRST_COLS)
+
+    cdf.to_csv(CLEAN_FULL_FPATH, index=True)
+    cdf[FIRST_COLS].to_csv(CLEAN_LIGHT_FPATH, index=True)
+
+    return cdf
+
+
+# --- manifest -----------------------------------------------------------
+
+# The manifest records, for each JSON, hash of its content and uuids of the rows created from it. It's what allows
+# update_full_df to process only new or changed JSONs
+
+
+def load_manifest():
+    """Returns the manifest, or None if it hasn't been created yet (by create_full_df)"""
+    if not os.path.exists(JSON_MANIFEST_FPATH):
+        return None
+
+    with open(JSON_MANIFEST_FPATH) as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest):
+    with open(JSON_MANIFEST_FPATH, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def _create_manifest_entry(json_fpath, uuids):
+    return {
+        'md5': get_file_hash(json_fpath),
+        'uuids': list(uuids),
+        'processed': datetime.datetime.now().isoformat()
+    }
+
+
+def _get_new_uuids(uids, taken_uuids):
+    """uuids for new rows - their uids, made unique among themselves and with respect to already taken uuids"""
+    taken_uuids = set(taken_uuids)
+    counts = collections.Counter(uids)
+
+    uuids = []
+    for uid in uids:
+        uuid = uid
+        k = 0
+        while uuid in taken_uuids or (counts[uid] > 1 and uuid == uid):
+            uuid = '{}_({})'.format(uid, k)
+            k += 1
+
+        taken_uuids.add(uuid)
+        uuids.append(uuid)
+
+    return uuids
+
+
+# --- creating the clean dataframes -----------------------------------------------------------
+
+
+def create_full_df(print_debug=True):
+    def _print(s=''):
+        if print_debug:
+            print(s)
 
     dfs = []
+    json_fpaths = []
 
     for i, json_fpath in enumerate(get_json_fpaths()):
         _print()
         _print('{}.) {}'.format(i, '-' * SEP_LEN))
 
-        try:
-            problems = []
-            df = json2df(json_fpath, problems, print_debug=print_debug)
-
-            if len(problems) != 0:
-                _print('PROBLEMS: {}'.format(', '.join([p[0] for p in problems])))
-        except json.JSONDecodeError as e:
-            _print('JSON decode ERROR: {}'.format(e))
-            continue
-        except Exception as e:
-            _print('ERROR: {}'.format(e))
+        df = _json2df_or_none(json_fpath, print_debug)
+        if df is None:
             continue
 
         dfs.append(df)
+        json_fpaths.append(json_fpath)
 
     _print('=' * SEP_LEN)
     _print('combining dataframes...')
@@ -73,17 +149,84 @@ def create_full_df(print_debug=True):
     cdf['uuid'] = gh.uniquify(cdf, 'uid')
     cdf = cdf.set_index('uuid')
 
-    cdf = gh.reorder_cols(cdf, first_cols=FIRST_COLS)
-
     _print('shape of final dataframe: {}'.format(cdf.shape))
 
-    cdf.to_csv(CLEAN_FULL_FPATH, index=True)
-    cdf[FIRST_COLS].to_csv(CLEAN_LIGHT_FPATH, index=True)
+    cdf = _save_clean_dfs(cdf)
+
+    boundaries = np.cumsum([0] + [len(df) for df in dfs])
+    _save_manifest(dict(
+        (os.path.basename(json_fpath), _create_manifest_entry(json_fpath, cdf.index[start:end]))
+        for json_fpath, start, end in zip(json_fpaths, boundaries[:-1], boundaries[1:])
+    ))
 
     return cdf
 
 
-def get_problems_report(json_fpaths=get_json_fpaths()):
+def update_full_df(print_debug=True):
+    """Incremental version of create_full_df - processes only JSONs that are new or changed since the last run
+    (according to the manifest), replaces rows created from changed or deleted JSONs and appends the new ones
+
+    :return: (the updated full dataframe, dataframe of the added rows, dataframe of the removed rows)
+    """
+    def _print(s=''):
+        if print_debug:
+            print(s)
+
+    manifest = load_manifest()
+    if manifest is None:
+        # without it, all JSONs would look new and the whole bank would be appended again
+        raise ValueError('No JSON manifest at {} - the clean dataframes were created by an older version, re-create '
+                         'them via create_full_df first'.format(JSON_MANIFEST_FPATH))
+
+    cdf = load_clean_df(full=True)
+
+    json_fpaths = dict((os.path.basename(f), f) for f in get_json_fpaths())
+    changed = [n for n, f in json_fpaths.items() if manifest.get(n, {}).get('md5') != get_file_hash(f)]
+    deleted = [n for n in manifest if n not in json_fpaths]
+
+    _print('{} new or changed and {} deleted JSONs'.format(len(changed), len(deleted)))
+    if len(changed) == 0 and len(deleted) == 0:
+        return cdf, cdf.iloc[:0], cdf.iloc[:0]
+
+    removed_uuids = [u for n in changed + deleted if n in manifest for u in manifest[n]['uuids']]
+    removed_df = cdf[cdf.index.isin(removed_uuids)]
+    cdf = cdf[~cdf.index.isin(removed_uuids)]
+    for n in deleted:
+        del manifest[n]
+
+    added_dfs = []
+    for i, name in enumerate(sorted(changed)):
+        _print()
+        _print('{}.) {}'.format(i, '-' * SEP_LEN))
+
+        df = _json2df_or_none(json_fpaths[name], print_debug)
+        if df is None:
+            manifest.pop(name, None)
+            continue
+
+        df = df.reset_index()
+        taken_uuids = list(cdf.index) + [u for adf in added_dfs for u in adf.index]
+        df['uuid'] = _get_new_uuids(list(df['uid']), taken_uuids)
+        df = df.set_index('uuid')
+
+        added_dfs.append(df)
+        manifest[name] = _create_manifest_entry(json_fpaths[name], df.index)
+
+    added_df = pd.concat(added_dfs) if len(added_dfs) > 0 else cdf.iloc[:0]
+
+    _print('=' * SEP_LEN)
+    _print('{} rows removed, {} rows added'.format(len(removed_df), len(added_df)))
+
+    cdf = _save_clean_dfs(pd.concat([cdf, added_df]))
+    _save_manifest(manifest)
+
+    return cdf, added_df, removed_df
+
+
+def get_problems_report(json_fpaths=None):
+    if json_fpaths is None:
+        json_fpaths = get_json_fpaths()
+
     stream = io.StringIO()
 
     for json_fpath in json_fpaths:
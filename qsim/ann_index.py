@@ -0,0 +1,135 @@
+"""
+Approximate nearest neighbour (ANN) index over unit vectors (e.g. precomputed question embeddings), so that a text can
+be matched against the whole question bank without scoring all of its questions.
+
+It's an inverted file (IVF) index: vectors are clustered by spherical k-means and, for a query, only vectors of the
+nprobe clusters with centroids closest to the query are scored. More clusters probed = better recall, but slower search
+(nprobe = n_lists gives exact results). Vectors of each cluster are stored contiguously, so probing a cluster is a single
+matrix-vector product
+"""
+
+import datetime
+import numpy as np
+
+
+DEF_NPROBE = 8
+
+# max number of vectors k-means is trained on (cluster assignment is then done for all of them)
+TRAIN_SAMPLE_SIZE = 50000
+
+# number of rows whose similarities to centroids are computed at once
+ASSIGN_BLOCK_SIZE = 10000
+
+
+class IvfIndex:
+    # increase whenever the stored structure changes, so that outdated indices are detected
+    VERSION = 1
+
+    def __init__(self, centroids, vectors, ids, list_offsets, data_hash=None):
+        """
+        :param centroids: n_lists x M matrix of unit centroids of the clusters
+        :param vectors: N x M matrix of the indexed unit vectors, ordered by cluster
+        :param ids: N ids (e.g. uuids) of the indexed vectors, in the same order
+        :param list_offsets: n_lists + 1 positions - vectors of cluster c are vectors[list_offsets[c]:list_offsets[c+1]]
+        """
+        self.version = self.VERSION
+        self.created = datetime.datetime.now()
+        self.data_hash = data_hash
+
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = np.array(ids)
+        self.list_offsets = np.array(list_offsets)
+
+    def __getstate__(self):
+        # vectors are stored separately (as .npy), see qsim_common.save_ann_index
+        state = self.__dict__.copy()
+        state['vectors'] = None
+        return state
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def create(cls, vectors, ids, n_lists=None, n_iter=10, seed=0, data_hash=None):
+        """Clusters vectors (rows with NaNs are left out) and builds the index
+
+        :param n_lists: number of clusters - sqrt(N) by default
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.array(ids)
+
+        valid = ~np.isnan(vectors).any(axis=1)
+        vectors, ids = vectors[valid], ids[valid]
+
+        n = len(vectors)
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        rnd = np.random.RandomState(seed)
+        centroids = cls._train_centroids(vectors, n_lists, n_iter, rnd)
+        assignment = cls._assign(vectors, centroids)
+
+        order = np.argsort(assignment, kind='stable')
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+
+        return cls(centroids, vectors[order], ids[order], list_offsets, data_hash)
+
+    @staticmethod
+    def _assign(vectors, centroids):
+        assignment = np.empty(len(vectors), dtype=int)
+        for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+            block = vectors[start:start + ASSIGN_BLOCK_SIZE]
+            assignment[start:start + len(block)] = block.dot(centroids.T).argmax(axis=1)
+
+        return assignment
+
+    @classmethod
+    def _train_centroids(cls, vectors, n_lists, n_iter, rnd):
+        """Spherical k-means - centroids are normalised to unit length, similarity is a dot product"""
+        if len(vectors) == 0:
+            return np.zeros((0, vectors.shape[1]), dtype=np.float32)
+
+        if len(vectors) > TRAIN_SAMPLE_SIZE:
+            vectors = vectors[rnd.choice(len(vectors), TRAIN_SAMPLE_SIZE, replace=False)]
+
+        centroids = vectors[rnd.choice(len(vectors), n_lists, replace=False)]
+
+        for _ in range(n_iter):
+            assignment = cls._assign(vectors, centroids)
+
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+
+            # empty clusters get a random vector as a new centroid
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            sums[empty] = vectors[rnd.choice(len(vectors), empty.sum())]
+
+            norms = np.linalg.norm(sums, axis=1)[:, np.newaxis]
+            centroids = sums / np.where(norms > 0, norms, 1)
+
+        return centroids.astype(np.float32)
+
+    def search(self, query_vec, k=10, nprobe=DEF_NPROBE):
+        """Returns (ids, similarities) of (approximately) k vectors most similar to query_vec (a unit vector), ordered
+        by similarity"""
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+        if self.n_lists == 0 or np.isnan(query_vec).any():
+            return self.ids[:0], np.zeros(0)
+
+        nprobe = min(nprobe, self.n_lists)
+        probed = np.argpartition(-self.centroids.dot(query_vec), nprobe - 1)[:nprobe]
+
+        candidates = np.concatenate([np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in probed])
+        sims = np.asarray(self.vectors[candidates]).dot(query_vec).astype(float)
+
+        k = min(k, len(candidates))
+        if k == 0:
+            return self.ids[:0], np.zeros(0)
+
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top], kind='stable')]
+
+        return self.ids[candidates[top]], sims[top]
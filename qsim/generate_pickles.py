@@ -5,11 +5,19 @@ models)
 
 from support.common import *
 
+import collections
 import logging
+import sys
+import numpy as np
 import gensim as gs
 import qsim.qsim_common as qsim
+import qsim.resources as resources
 from qsim.qsim_common import W2vModelName
 from qsim.sims.sent_vec_sim import SentVecSim
+from qsim.sims.avg_word_vec_sim import AvgWordVecSim
+from qsim.sims.tfidf_cos_sim import TfidfCosSim
+from qsim.word_vectors import WordVectors
+import json_to_df.json2df as json2df
 
 import nltk
 from gensim.models import word2vec
@@ -18,6 +26,15 @@ from gensim.models import word2vec
 PROCESSED_COLS = ['all_text', 'all_context', 'all_inclusions', 'all_exclusions', 'notes']
 QBANK_TRAINED_MODEL_FPATH = CHECKPT_DIR + '/w2v.model'
 
+# columns compared one by one (e.g. in the dashboard), whose values are preprocessed in advance too
+PREPROCESSED_COLS = ['suff_qtext', 'type', 'close_seg_text', 'all_inclusions', 'all_exclusions']
+
+# columns sims are fitted on (see fit_and_save_sim_model) - the ones the dashboard compares by default
+FITTED_SIM_COLS = ['suff_qtext', 'type']
+
+# number of processes the question bank is preprocessed in (None = all CPUs)
+PREPROCESSING_N_JOBS = None
+
 
 def get_sentences():
     df = load_clean_df()
@@ -68,6 +85,19 @@ def create_and_pickle_word_frequencies():
 
     word_freq_dict = dict(fd.items())
     qsim.pickle_word_frequencies(word_freq_dict)
+    resources.invalidate(resources.WORD_FREQUENCIES)
+
+
+def update_and_pickle_word_frequencies(added_df, removed_df):
+    print('updating word frequencies...')
+    wf_dict = collections.Counter(qsim.load_word_frequencies_dict())
+
+    wf_dict.update(w for s in qsim.create_sentences(added_df, PROCESSED_COLS) for w in s)
+    wf_dict.subtract(w for s in qsim.create_sentences(removed_df, PROCESSED_COLS) for w in s)
+
+    word_freq_dict = dict((w, f) for w, f in wf_dict.items() if f > 0)
+    qsim.pickle_word_frequencies(word_freq_dict)
+    resources.invalidate(resources.WORD_FREQUENCIES)
 
 
 def get_and_pickle_word_vectors(model_name):
@@ -77,14 +107,12 @@ def get_and_pickle_word_vectors(model_name):
     sentences = get_sentences()
 
     vocab = set(w for s in sentences for w in s)
+    words = sorted(v for v in vocab if v in model)
 
-    wv_dict = {}
-    for v in vocab:
-        if v not in model:
-            continue
-        wv_dict[v] = model[v]
+    vectors = np.array([model[w] for w in words], dtype=np.float32).reshape(len(words), model.vector_size)
 
-    qsim.pickle_word_vectors(wv_dict, model_name)
+    qsim.save_word_vectors(WordVectors(words, vectors), model_name)
+    resources.invalidate(resources.WORD_VECTORS)
 
 
 def get_and_pickle_1st_pc(sent_vec_sim, model_name, rem_stopwords):
@@ -93,17 +121,152 @@ def get_and_pickle_1st_pc(sent_vec_sim, model_name, rem_stopwords):
 
     first_pc = sent_vec_sim.get_first_pc(df)
     qsim.pickle_1st_pc(first_pc, model_name, rem_stopwords)
+    resources.invalidate(resources.FIRST_PC)
+
+
+def create_and_pickle_tfidf_index(tfidf_cos_sim):
+    name = tfidf_cos_sim.get_tfidf_index_name()
+    print('creating TF-IDF index - {}...'.format(name))
+    df = load_clean_df()
+
+    tfidf_index = tfidf_cos_sim.create_tfidf_index(df, data_hash=get_file_hash(CLEAN_LIGHT_FPATH))
+    qsim.pickle_tfidf_index(tfidf_index, name)
+    resources.invalidate(resources.TFIDF_INDEX)
+
+
+def create_and_save_question_embeddings(embeddings_based_sim):
+    data_hash = get_file_hash(CLEAN_LIGHT_FPATH)
+    name = embeddings_based_sim.get_question_embeddings_name(data_hash)
+    print('creating question embeddings - {}...'.format(name))
+    df = load_clean_df()
+
+    question_embeddings = embeddings_based_sim.create_question_embeddings(df, data_hash=data_hash)
+    qsim.save_question_embeddings(question_embeddings, name)
+    resources.invalidate(resources.QUESTION_EMBEDDINGS)
+
+    create_and_save_ann_index(embeddings_based_sim, question_embeddings, name)
+
+
+def create_and_save_ann_index(embeddings_based_sim, question_embeddings, name):
+    print('creating ANN index - {}...'.format(name))
+
+    ann_index = embeddings_based_sim.create_ann_index(question_embeddings)
+    qsim.save_ann_index(ann_index, name)
+    resources.invalidate(resources.ANN_INDEX)
+
+
+def fit_and_save_sim_model(sim, name=None):
+    """Fits the sim's model (e.g. IDFs of words) on the whole question bank and saves it, so that sims loading it
+    (see BaseSim.load) score new texts without fitting anything"""
+    name = name or sim.get_model_name()
+    print('fitting sim model - {}...'.format(name))
+    df = load_clean_df()
+
+    sim.fit(df).save(name, data_hash=get_file_hash(CLEAN_LIGHT_FPATH))
+
+
+def fill_and_pickle_preprocessing_cache(df, clear=False):
+    """Preprocesses questions of df (and values of PREPROCESSED_COLS) the way the default sims do and persists
+    the resulting preprocessing cache, so that preprocessing of the question bank is paid once, here"""
+    print('preprocessing {} questions...'.format(len(df)))
+
+    preprocessing_cache = resources.get_preprocessing_cache()
+    if clear:
+        preprocessing_cache.clear()
+
+    # AvgWordVecSim and SentVecSim preprocess texts the same way, as do ExactSim and TfidfCosSim
+    sims = [TfidfCosSim(preprocessing_n_jobs=PREPROCESSING_N_JOBS)] + [
+        AvgWordVecSim(wv_dict_model_name=model_name, preprocessing_n_jobs=PREPROCESSING_N_JOBS)
+        for model_name in W2vModelName
+    ]
+    for sim in sims:
+        sim.precompute_preprocessing(df, PREPROCESSED_COLS)
+
+    qsim.pickle_preprocessing_cache(preprocessing_cache)
+
+
+def update_and_pickle_tfidf_index(tfidf_cos_sim, added_df, removed_df):
+    name = tfidf_cos_sim.get_tfidf_index_name()
+    print('updating TF-IDF index - {}...'.format(name))
+
+    tfidf_index = tfidf_cos_sim.update_tfidf_index(qsim.load_tfidf_index(name), added_df, removed_df.index,
+                                                   data_hash=get_file_hash(CLEAN_LIGHT_FPATH))
+    qsim.pickle_tfidf_index(tfidf_index, name)
+    resources.invalidate(resources.TFIDF_INDEX)
+
+
+def update_and_save_question_embeddings(embeddings_based_sim, prev_data_hash, added_df, removed_df):
+    data_hash = get_file_hash(CLEAN_LIGHT_FPATH)
+    name = embeddings_based_sim.get_question_embeddings_name(data_hash)
+    print('updating question embeddings - {}...'.format(name))
+
+    prev_question_embeddings = qsim.load_question_embeddings(
+        embeddings_based_sim.get_question_embeddings_name(prev_data_hash))
+
+    question_embeddings = embeddings_based_sim.update_question_embeddings(prev_question_embeddings, added_df,
+                                                                          removed_df.index, data_hash=data_hash)
+    qsim.save_question_embeddings(question_embeddings, name)
+    resources.invalidate(resources.QUESTION_EMBEDDINGS)
+
+    create_and_save_ann_index(embeddings_based_sim, question_embeddings, name)
+
+
+def update_incrementally():
+    """Processes only new or changed JSONs (see json2df.update_full_df) and updates word frequencies, TF-IDF index
+    and question embeddings accordingly, instead of re-creating everything. Word vector models, first PCs and fitted
+    sim models are kept as they are - run the full generation once in a while to refresh them"""
+    prev_data_hash = get_file_hash(CLEAN_LIGHT_FPATH)
+    prev_df = load_clean_df()
+
+    _, added_df, removed_df = json2df.update_full_df()
+    if len(added_df) == 0 and len(removed_df) == 0:
+        print('nothing to update')
+        return
+
+    # json2df gives all columns with their raw values (e.g. survey_id '002'), while the pickles are generated from
+    # the light CSV as read by load_clean_df - so the rows are taken from it, to be preprocessed the same way
+    added_df = load_clean_df().loc[added_df.index]
+    removed_df = prev_df.loc[removed_df.index]
+
+    update_and_pickle_word_frequencies(added_df, removed_df)
+
+    update_and_pickle_tfidf_index(TfidfCosSim(preprocessing_n_jobs=PREPROCESSING_N_JOBS), added_df, removed_df)
+
+    fill_and_pickle_preprocessing_cache(added_df)
+
+    for model_name in W2vModelName:
+        for sim_class in [AvgWordVecSim, SentVecSim]:
+            update_and_save_question_embeddings(sim_class(wv_dict_model_name=model_name), prev_data_hash, added_df,
+                                                removed_df)
 
 
 if __name__ == '__main__':
+    if '--incremental' in sys.argv:
+        update_incrementally()
+        sys.exit()
+
     train_w2v()
 
     create_and_pickle_word_frequencies()
 
+    create_and_pickle_tfidf_index(TfidfCosSim(preprocessing_n_jobs=PREPROCESSING_N_JOBS))
+
     get_and_pickle_word_vectors(W2vModelName.PretrainedGoogleNews)
     get_and_pickle_word_vectors(W2vModelName.QbankTrained)
 
+    fill_and_pickle_preprocessing_cache(load_clean_df(), clear=True)
+
     for model_name in W2vModelName:
         for rem_stopwords in [True, False]:
             sim = SentVecSim(wv_dict_model_name=model_name, rem_stopwords=rem_stopwords, use_precomputed_first_pc=False)
             get_and_pickle_1st_pc(sim, model_name, rem_stopwords)
+
+    for model_name in W2vModelName:
+        for sim_class in [AvgWordVecSim, SentVecSim]:
+            create_and_save_question_embeddings(sim_class(wv_dict_model_name=model_name))
+
+    fit_and_save_sim_model(TfidfCosSim(cols=FITTED_SIM_COLS))
+    for model_name in W2vModelName:
+        fit_and_save_sim_model(AvgWordVecSim(cols=FITTED_SIM_COLS, wv_dict_model_name=model_name))
+        fit_and_save_sim_model(SentVecSim(cols=FITTED_SIM_COLS, wv_dict_model_name=model_name,
+                                          use_precomputed_first_pc=False))
@@ -0,0 +1,240 @@
+"""
+Batch Jaro-Winkler similarity. Gives identical results to pyjarowinkler's get_jaro_distance(x, y, winkler=True,
+scaling=0.1) (including its quirks, e.g. rounding to 2 decimal places), but scores many pairs of strings at once using
+NumPy, instead of looping over characters in Python for each pair.
+
+How it works: pyjarowinkler's matching goes over characters of one string and for each checks, whether the same
+character is present (and not yet matched) within a window in the other string. If so, it marks the *first* unmatched
+occurrence of that character (in the whole string) as matched. Thus occurrences of each character are always matched
+from left to right, and the state of matching can be kept as a count of matched occurrences per (pair, character). The
+occurrences of each character of each string are kept in a single sorted array of keys, so that "is there an unmatched
+occurrence within the window" becomes a binary search - done for all pairs at once, one character position at a time.
+"""
+
+import numpy as np
+from pyjarowinkler import distance as pyjarodist
+
+
+# pyjarowinkler marks matched characters by replacing them with this. Strings containing it would match these marks, so
+# they are left to pyjarowinkler itself
+MATCHED_MARK = '*'
+
+PREFIX_LEN = 4
+
+DEF_CHUNK_SIZE = 20000
+
+
+class JaroWinkler:
+    def __init__(self, texts, scaling=0.1, alphabet=None):
+        """Encodes texts, so that any pairs of them can be then scored via get_pair_sims
+
+        :param alphabet: sorted code points characters are encoded by (see encode_other). By default it's the
+        characters of the texts
+        """
+        self._texts = list(texts)
+        self._scaling = scaling
+
+        n = len(self._texts)
+        orig = np.array(self._texts, dtype=str).reshape(n)
+        lower = np.char.lower(orig)
+
+        self._orig_lens = np.char.str_len(orig).astype(np.int64)
+        self._lens = np.char.str_len(lower).astype(np.int64)
+        self._has_mark = np.char.find(lower, MATCHED_MARK) >= 0
+
+        # original (case sensitive) code points of the first few characters - for the Winkler's common prefix
+        self._prefix_codes = self._get_code_points(orig, n)[:, :PREFIX_LEN]
+        self._prefix_codes = np.pad(self._prefix_codes, ((0, 0), (0, PREFIX_LEN - self._prefix_codes.shape[1])))
+
+        # characters (of lowercased texts) encoded as small integers 0..A-1. Characters outside of a given alphabet get
+        # code A, which is reserved for them (so they never match a character of texts encoded by the alphabet)
+        code_points = self._get_code_points(lower, n)
+        if alphabet is None:
+            alphabet, codes = np.unique(code_points, return_inverse=True)
+        else:
+            codes = self._encode_by_alphabet(code_points, alphabet)
+        self._alphabet = alphabet
+        self._codes = codes.reshape(code_points.shape)
+        self._alphabet_size = len(alphabet) + 1
+        self._key_stride = self._codes.shape[1] + 1
+
+        # one key per (text, character, position), sorted - i.e. grouped by text and character, then by position
+        positions = np.arange(self._codes.shape[1])
+        text_idx, pos = np.nonzero(positions[np.newaxis, :] < self._lens[:, np.newaxis])
+        self._keys = np.sort(self._get_key_base(text_idx, self._codes[text_idx, pos]) + pos)
+
+        # where the occurrences of each character of each text start in the keys (n x A)
+        all_bases = self._get_key_base(np.arange(n)[:, np.newaxis], np.arange(self._alphabet_size)[np.newaxis, :])
+        self._first_occurrences = np.searchsorted(self._keys, all_bases)
+
+    @staticmethod
+    def _get_code_points(str_array, n):
+        width = str_array.dtype.itemsize // 4
+        if width == 0:
+            return np.zeros((n, 0), dtype=np.uint32)
+
+        return np.ascontiguousarray(str_array).view(np.uint32).reshape(n, width)
+
+    @staticmethod
+    def _encode_by_alphabet(code_points, alphabet):
+        if len(alphabet) == 0:
+            return np.zeros(code_points.shape, dtype=np.int64)
+
+        codes = np.searchsorted(alphabet, code_points)
+        known = alphabet[np.minimum(codes, len(alphabet) - 1)] == code_points
+
+        return np.where(known, codes, len(alphabet))
+
+    def _get_key_base(self, text_idx, char_codes):
+        return (text_idx * self._alphabet_size + char_codes) * self._key_stride
+
+    def encode_other(self, texts):
+        """Returns JaroWinkler of other texts (e.g. queries) encoded by the alphabet of these ones, so that they can be
+        scored against these texts without encoding them again (see get_other_pair_sims)"""
+        return JaroWinkler(texts, self._scaling, self._alphabet)
+
+    # --- scoring -----------------------------------------------------------
+
+    # Pairs are scored as (first texts[xs[i]], second texts[ys[i]]), where first and second are JaroWinklers encoded by
+    # the same alphabet - usually both are this one
+
+    @staticmethod
+    def _match(first_jw, first, second_jw, second, limit):
+        """Vectorised version of pyjarowinkler's _get_matching_characters(first, second) for pairs of texts given by
+        their positions. Returns (matched character codes - one row per pair, counts of matched characters)"""
+        k = len(first)
+        keys = second_jw._keys
+
+        # sort pairs by length of first texts (descending), so that only a prefix of pairs is active at each step
+        order = np.argsort(-first_jw._lens[first], kind='stable')
+        first, second, limit = first[order], second[order], limit[order]
+        lens_first = first_jw._lens[first]
+        lens_second = second_jw._lens[second]
+        max_len = lens_first[0] if k > 0 else 0
+
+        matched = np.full((k, max_len), -1, dtype=np.int64)
+        counts = np.zeros(k, dtype=np.int64)
+        consumed = np.zeros((k, first_jw._alphabet_size), dtype=np.int64)
+        n_keys = len(keys)
+
+        for i in range(max_len):
+            active = np.searchsorted(-lens_first, -i, side='left')  # count of pairs with len(first) > i
+            pairs = np.arange(active)
+
+            chars = first_jw._codes[first[:active], i]
+            base = second_jw._get_key_base(second[:active], chars)
+            left = np.maximum(0, i - limit[:active])
+            right = np.minimum(i + limit[:active] + 1, lens_second[:active])
+
+            # first unmatched occurrence of the character at position >= left...
+            first_unmatched = second_jw._first_occurrences[second[:active], chars] + consumed[pairs, chars]
+            candidate = np.maximum(np.searchsorted(keys, base + left), first_unmatched)
+
+            # ... must be within the window (keys of other characters/texts are either < base or >= base + stride)
+            found = (candidate < n_keys) & (keys[np.minimum(candidate, n_keys - 1)] < base + right)
+
+            found_pairs = pairs[found]
+            found_chars = chars[found]
+            matched[found_pairs, counts[found_pairs]] = found_chars
+            counts[found_pairs] += 1
+            consumed[found_pairs, found_chars] += 1
+
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(k)
+
+        return matched[inverse], counts[inverse]
+
+    @staticmethod
+    def _get_oriented_jaro(shorter_jw, shorter, longer_jw, longer):
+        len_shorter = shorter_jw._lens[shorter]
+        len_longer = longer_jw._lens[longer]
+        limit = np.minimum(len_shorter, len_longer) // 2
+
+        m1, n1 = JaroWinkler._match(shorter_jw, shorter, longer_jw, longer, limit)
+        m2, n2 = JaroWinkler._match(longer_jw, longer, shorter_jw, shorter, limit)
+
+        # transpositions - half of the positions, where the two sequences of matched characters differ
+        width = min(m1.shape[1], m2.shape[1])
+        in_both = np.arange(width)[np.newaxis, :] < np.minimum(n1, n2)[:, np.newaxis]
+        transpositions = ((m1[:, :width] != m2[:, :width]) & in_both).sum(axis=1) // 2
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jaro = (n1 / len_shorter + n2 / len_longer + (n1 - transpositions) / n1) / 3.0
+
+        return np.where((n1 == 0) | (n2 == 0), 0.0, jaro)
+
+    @staticmethod
+    def _get_jaro(first_jw, xs, second_jw, ys):
+        # pyjarowinkler swaps based on original lengths, but uses lengths of lowercased texts afterwards
+        swap = first_jw._orig_lens[xs] > second_jw._orig_lens[ys]
+
+        jaro = np.empty(len(xs))
+        jaro[~swap] = JaroWinkler._get_oriented_jaro(first_jw, xs[~swap], second_jw, ys[~swap])
+        jaro[swap] = JaroWinkler._get_oriented_jaro(second_jw, ys[swap], first_jw, xs[swap])
+
+        return jaro
+
+    @staticmethod
+    def _get_prefix_lens(first_jw, xs, second_jw, ys):
+        min_lens = np.minimum(first_jw._orig_lens[xs], second_jw._orig_lens[ys])
+        same = (first_jw._prefix_codes[xs] == second_jw._prefix_codes[ys]) & \
+               (np.arange(PREFIX_LEN)[np.newaxis, :] < min_lens[:, np.newaxis])
+
+        return np.cumprod(same, axis=1).sum(axis=1)
+
+    @staticmethod
+    def _get_pair_sims_chunk(first_jw, xs, second_jw, ys):
+        jaro = JaroWinkler._get_jaro(first_jw, xs, second_jw, ys)
+        cl = JaroWinkler._get_prefix_lens(first_jw, xs, second_jw, ys)
+
+        scaling = second_jw._scaling
+        sims = np.round((jaro + (scaling * cl * (1.0 - jaro))) * 100.0) / 100.0
+
+        # pyjarowinkler fails on empty texts
+        empty = (first_jw._lens[xs] == 0) | (second_jw._lens[ys] == 0)
+        sims[empty] = np.nan
+
+        for i in np.flatnonzero((first_jw._has_mark[xs] | second_jw._has_mark[ys]) & ~empty):
+            sims[i] = pyjarodist.get_jaro_distance(first_jw._texts[xs[i]], second_jw._texts[ys[i]], winkler=True,
+                                                   scaling=scaling)
+
+        return sims
+
+    @staticmethod
+    def _get_pair_sims(first_jw, xs, second_jw, ys, chunk_size):
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+
+        sims = np.empty(len(xs))
+        for start in range(0, len(xs), chunk_size):
+            end = start + chunk_size
+            sims[start:end] = JaroWinkler._get_pair_sims_chunk(first_jw, xs[start:end], second_jw, ys[start:end])
+
+        return sims
+
+    def get_pair_sims(self, xs, ys, chunk_size=DEF_CHUNK_SIZE):
+        """Returns Jaro-Winkler similarities of pairs (texts[xs[i]], texts[ys[i]]). NaN for pairs with an empty text"""
+        return self._get_pair_sims(self, xs, self, ys, chunk_size)
+
+    def get_other_pair_sims(self, other, xs, ys, chunk_size=DEF_CHUNK_SIZE):
+        """Returns Jaro-Winkler similarities of pairs (other texts[xs[i]], texts[ys[i]]), where other was encoded via
+        encode_other. NaN for pairs with an empty text"""
+        return self._get_pair_sims(other, xs, self, ys, chunk_size)
+
+    def get_sims(self, x, ys=None):
+        """Returns Jaro-Winkler similarities of text at position x to texts at positions ys (all texts by default)"""
+        ys = np.arange(len(self._texts)) if ys is None else np.asarray(ys, dtype=np.int64)
+
+        return self.get_pair_sims(np.full(len(ys), x), ys)
+
+    def get_text_sims(self, text):
+        """Returns Jaro-Winkler similarities of a text (not necessarily one of the encoded ones) to all texts. Only
+        the text is encoded"""
+        n = len(self._texts)
+
+        return self.get_other_pair_sims(self.encode_other([text]), np.zeros(n, dtype=np.int64), np.arange(n))
+
+
+def get_jaro_winkler_sims(text, texts, scaling=0.1):
+    """Returns Jaro-Winkler similarities of text to each of texts"""
+    return JaroWinkler(texts, scaling).get_text_sims(text)
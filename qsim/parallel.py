@@ -0,0 +1,50 @@
+"""
+Helpers for running CPU heavy work in a pool of processes. Large read-only inputs (e.g. encoded texts) and shared
+result arrays are handed to the workers by forking - they are stored in a module global right before the pool is
+created, so they are never pickled, no matter how many tasks there are.
+"""
+
+import ctypes
+import multiprocessing as mp
+import os
+import numpy as np
+
+
+_inherited = {}
+
+
+def get_n_jobs(n_jobs=None):
+    """Number of worker processes to use - all CPUs if n_jobs is None or not positive"""
+    if n_jobs is None or n_jobs <= 0:
+        return os.cpu_count() or 1
+
+    return n_jobs
+
+
+def create_shared_array(size, dtype=np.float64):
+    """Creates a numpy array backed by shared memory, so that forked workers can write their results straight into it"""
+    ctype = ctypes.c_float if np.dtype(dtype) == np.float32 else ctypes.c_double
+    raw = mp.RawArray(ctype, max(1, int(size)))
+
+    return np.frombuffer(raw, dtype=dtype)[:size]
+
+
+def get_inherited(name):
+    """Returns object passed to run_in_pool via `inherited` - to be called from within the worker function"""
+    return _inherited[name]
+
+
+def run_in_pool(func, tasks, n_jobs=None, inherited=None):
+    """Runs func(task) for all tasks in a pool of forked processes and returns the results in order of tasks
+
+    :param func: module level function (it must be picklable)
+    :param inherited: dict of objects available to func via get_inherited(name), without being pickled
+    """
+    global _inherited
+    _inherited = inherited if inherited is not None else {}
+
+    try:
+        with mp.get_context('fork').Pool(get_n_jobs(n_jobs)) as pool:
+            return pool.map(func, tasks, chunksize=1)
+    finally:
+        _inherited = {}
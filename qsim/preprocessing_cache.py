@@ -0,0 +1,75 @@
+"""
+Cache of preprocessed texts, keyed by the text and by the preprocessing options (see BaseSim._get_preprocessing_key), so
+that each distinct text is preprocessed only once per set of options - across sims and requests. Memory is bounded by
+the max number of entries (least recently used ones are dropped). The cache can be persisted to CHECKPT_DIR, e.g.
+with all questions of the clean dataset preprocessed for the default sims (see generate_pickles.py)
+"""
+
+import collections
+import threading
+
+
+DEF_MAX_ENTRIES = 500000
+
+
+class PreprocessingCache:
+    def __init__(self, max_entries=DEF_MAX_ENTRIES):
+        self.max_entries = max_entries
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, options_key, text, preprocess):
+        """Returns preprocessed text - from the cache, or computed via preprocess(text) and cached"""
+        return self.get_many(options_key, [text], lambda texts: [preprocess(t) for t in texts])[0]
+
+    def get_many(self, options_key, texts, preprocess_many):
+        """Returns list of preprocessed texts - from the cache, or (for those not cached) computed at once via
+        preprocess_many(list of texts) and cached"""
+        with self._lock:
+            cached = {}
+            for text in texts:
+                key = (options_key, text)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    cached[text] = self._entries[key]
+
+            self.hits += sum(1 for t in texts if t in cached)
+
+        missing = list(dict.fromkeys(t for t in texts if t not in cached))
+        computed = dict(zip(missing, preprocess_many(missing))) if len(missing) > 0 else {}
+
+        with self._lock:
+            self.misses += len(missing)
+            for text, proc_text in computed.items():
+                self._entries[(options_key, text)] = proc_text
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return [cached[t] if t in cached else computed[t] for t in texts]
+
+    def clear(self, options_key=None):
+        """Drops entries of given preprocessing options (all of them if options_key is None)"""
+        with self._lock:
+            if options_key is None:
+                self._entries.clear()
+                return
+
+            for key in [k for k in self._entries if k[0] == options_key]:
+                del self._entries[key]
@@ -10,7 +10,11 @@ import json_to_df.dataframing as dataframing
 import nltk
 from gensim.models import Phrases
 import numpy as np
+import scipy.sparse as sp
 from enum import Enum
+from qsim.word_vectors import WordVectors
+from qsim.preprocessing_cache import PreprocessingCache
+from qsim.survey_index import SurveyIndex
 
 
 class W2vModelName(Enum):
@@ -19,6 +23,7 @@ class W2vModelName(Enum):
 
 
 DEF_WF_DICT_NAME = 'wf.dict'
+PREPROCESSING_CACHE_NAME = 'preproc-cache'
 
 
 # --- pickling -----------------------------------------------------------
@@ -40,12 +45,30 @@ def _get_wv_dict_pickle_name(model_name):
     return 'wv.{}.dict'.format(model_name.name)
 
 
-def pickle_word_vectors(wv_dict, model_name):
-    save_pickled_obj(wv_dict, _get_wv_dict_pickle_name(model_name))
+def _get_wv_vocab_pickle_name(model_name):
+    return 'wv.{}.vocab'.format(model_name.name)
+
+
+def _get_wv_vectors_npy_name(model_name):
+    return 'wv.{}.vectors'.format(model_name.name)
+
+
+def save_word_vectors(word_vectors, model_name):
+    """Stores WordVectors as a float32 .npy matrix (memory-mapped when loaded) and a pickled list of words"""
+    save_npy_array(np.asarray(word_vectors.vectors, dtype=np.float32), _get_wv_vectors_npy_name(model_name))
+    save_pickled_obj(word_vectors.words, _get_wv_vocab_pickle_name(model_name))
 
 
 def load_word_vectors(model_name):
-    return load_pickled_obj(_get_wv_dict_pickle_name(model_name))
+    """Returns WordVectors (a dict-like word -> vector). Falls back to the old pickled dict, if the .npy matrix hasn't
+    been generated yet"""
+    if not npy_array_exists(_get_wv_vectors_npy_name(model_name)):
+        return WordVectors.from_dict(load_pickled_obj(_get_wv_dict_pickle_name(model_name)))
+
+    words = load_pickled_obj(_get_wv_vocab_pickle_name(model_name))
+    vectors = load_npy_array(_get_wv_vectors_npy_name(model_name))
+
+    return WordVectors(words, vectors)
 
 
 def _get_1st_pc_pickle_name(model_name, rem_stopwords):
@@ -60,6 +83,80 @@ def load_1st_pc(model_name, rem_stopwords):
     return load_pickled_obj(_get_1st_pc_pickle_name(model_name, rem_stopwords))
 
 
+def _get_tfidf_index_pickle_name(name):
+    return 'tfidf-index.{}'.format(name)
+
+
+def pickle_tfidf_index(tfidf_index, name):
+    save_pickled_obj(tfidf_index, _get_tfidf_index_pickle_name(name))
+
+
+def load_tfidf_index(name):
+    return load_pickled_obj(_get_tfidf_index_pickle_name(name))
+
+
+def _get_question_embeddings_name(name):
+    return 'emb.{}'.format(name)
+
+
+def save_question_embeddings(question_embeddings, name):
+    """Stores QuestionEmbeddings as a float32 .npy matrix (memory-mapped when loaded) and pickled metadata"""
+    save_npy_array(np.asarray(question_embeddings.vectors, dtype=np.float32), _get_question_embeddings_name(name))
+    save_pickled_obj(question_embeddings, _get_question_embeddings_name(name))
+
+
+def load_question_embeddings(name):
+    question_embeddings = load_pickled_obj(_get_question_embeddings_name(name))
+    question_embeddings.vectors = load_npy_array(_get_question_embeddings_name(name))
+
+    return question_embeddings
+
+
+def _get_ann_index_name(name):
+    return 'ann.{}'.format(name)
+
+
+def save_ann_index(ann_index, name):
+    """Stores IvfIndex as a float32 .npy matrix of the indexed vectors (memory-mapped when loaded) and the pickled rest"""
+    save_npy_array(np.asarray(ann_index.vectors, dtype=np.float32), _get_ann_index_name(name))
+    save_pickled_obj(ann_index, _get_ann_index_name(name))
+
+
+def load_ann_index(name):
+    ann_index = load_pickled_obj(_get_ann_index_name(name))
+    ann_index.vectors = load_npy_array(_get_ann_index_name(name))
+
+    return ann_index
+
+
+def _get_sim_model_pickle_name(name):
+    return 'sim-model.{}'.format(name)
+
+
+def pickle_sim_model(sim_model, name):
+    save_pickled_obj(sim_model, _get_sim_model_pickle_name(name))
+
+
+def sim_model_exists(name):
+    return pickled_obj_exists(_get_sim_model_pickle_name(name))
+
+
+def load_sim_model(name):
+    return load_pickled_obj(_get_sim_model_pickle_name(name))
+
+
+def pickle_preprocessing_cache(preprocessing_cache, name=PREPROCESSING_CACHE_NAME):
+    save_pickled_obj(preprocessing_cache, name)
+
+
+def load_preprocessing_cache(name=PREPROCESSING_CACHE_NAME):
+    """Returns the persisted PreprocessingCache, or an empty one if it hasn't been generated yet"""
+    if not pickled_obj_exists(name):
+        return PreprocessingCache()
+
+    return load_pickled_obj(name)
+
+
 # --- other helper functions -----------------------------------------------------------
 
 def get_stop_words():
@@ -108,16 +205,28 @@ def sent2words(sent):
     return words
 
 
-def exp_scale(X, base=10):
+def exp_scale(X, base=10, out=None):
     """Scales the values in X (0-1) to a new scale 0-1. If base > 1, values < 1 are reduced as their distance from 1 increases
 
     X = np.linspace(0, 1, 20)
     base = 10
     plt.plot(X, (base**X - 1)/(base - 1), show)
     plt.grid()
+
+    :param out: array to store the result in (e.g. X itself, to scale it in place). The dtype of float X is kept,
+    other X is scaled as float64
     """
+    X = np.asarray(X)
+    if np.issubdtype(X.dtype, np.floating):
+        base = X.dtype.type(base)
+    else:
+        X = X.astype(float)
 
-    return (base**X - 1) / (base - 1)
+    res = np.power(base, X, out=out)
+    res -= 1
+    res /= base - 1
+
+    return res
 
 
 def create_sentences(df, cols):
@@ -143,13 +252,62 @@ def detect_phrases(sents, max_length=5, **kwargs):
     return detect_phrases(list(phrases[sents]), max_length - 1, **kwargs)
 
 
-def get_cross_survey_matrix(df):
-    sur_ids = np.array(df['survey_id'])
-    n = len(df)
+def get_top_k_indices(values, k):
+    """Returns indices of (up to) k largest values, ordered from the largest. NaN values are never returned
+
+    Uses partial sorting, so it's O(n) rather than O(n log n) for small k
+    """
+    candidates = np.flatnonzero(~np.isnan(values))
+
+    if len(candidates) > k:
+        top = np.argpartition(-values[candidates], k - 1)[:k] if k > 0 else []
+        candidates = candidates[top]
 
-    S = np.repeat(sur_ids, n).reshape(n, n)
-    cross_survey_matrix = ~(S == S.T)
+    return candidates[np.argsort(-values[candidates], kind='stable')]
+
+
+# IDF (smoothed, as in TfidfVectorizer) of a word present in only one of two documents - when fitted on just these two.
+# Words present in both of them get IDF of 1
+PAIR_ONLY_IDF = 1 + np.log(1.5)
+
+
+def get_pairwise_tfidf(count_matrix, xs, ys):
+    """For pairs of texts given by rows xs and ys of count_matrix (sparse, texts x words), returns their (not normalised)
+    TF-IDF vectors as a TfidfVectorizer fitted on just the two texts of each pair would give them. Allows scoring many
+    pairs at once, without fitting a model for each of them
+
+    :return: (sparse matrix of TF-IDF vectors of xs, the same for ys)
+    """
+    cx = count_matrix[xs].astype(float)
+    cy = count_matrix[ys].astype(float)
+
+    in_both_x = cx.multiply(cy > 0)
+    in_both_y = cy.multiply(cx > 0)
+
+    tfidf_x = cx * PAIR_ONLY_IDF - in_both_x * (PAIR_ONLY_IDF - 1)
+    tfidf_y = cy * PAIR_ONLY_IDF - in_both_y * (PAIR_ONLY_IDF - 1)
+
+    return tfidf_x.tocsr(), tfidf_y.tocsr()
+
+
+def get_rowwise_cos_sims(X, Y):
+    """Cosine similarities of corresponding rows of X and Y (dense or sparse). 0 for rows of zero length"""
+    if sp.issparse(X):
+        dots = np.asarray(X.multiply(Y).sum(axis=1)).ravel()
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel() * np.asarray(Y.multiply(Y).sum(axis=1)).ravel())
+    else:
+        dots = (X * Y).sum(axis=1)
+        norms = np.linalg.norm(X, axis=1) * np.linalg.norm(Y, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(norms > 0, dots / norms, 0.0)
+
+
+def get_cross_survey_matrix(df):
+    """N x N bool matrix - whether questions are from different surveys. Prefer SurveyIndex, which doesn't need it"""
+    survey_index = SurveyIndex.from_df(df)
+    rows = np.arange(len(df))
 
-    return cross_survey_matrix
+    return survey_index.is_cross_survey(rows[:, np.newaxis], rows[np.newaxis, :])
 
 
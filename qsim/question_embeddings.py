@@ -0,0 +1,65 @@
+"""
+Precomputed unit vectors of all questions in the question bank for an embeddings based sim (see EmbeddingsBasedSim).
+They are built once (see generate_pickles.py) and stored as a float32 .npy matrix (memory-mapped when loaded) plus
+pickled metadata in CHECKPT_DIR. Similarities of any questions from the bank are then just dot products of their rows
+"""
+
+import datetime
+import numpy as np
+
+
+class QuestionEmbeddings:
+    # increase whenever the stored structure changes, so that outdated embeddings are detected
+    VERSION = 2
+
+    def __init__(self, uuids, vectors, model, data_hash=None):
+        """
+        :param uuids: list of N uuids of the questions
+        :param vectors: N x M matrix of unit question vectors (rows of questions without usable words are NaNs)
+        :param model: model the vectors were created with (e.g. fitted TF-IDF vectorizer), used to embed other texts
+        """
+        self.version = self.VERSION
+        self.created = datetime.datetime.now()
+        self.data_hash = data_hash
+
+        self.uuids = np.array(uuids)
+        self.vectors = vectors
+        self.model = model
+
+        self._uuid2row = None
+
+    def __getstate__(self):
+        # vectors are stored separately (as .npy), see qsim_common.save_question_embeddings
+        state = self.__dict__.copy()
+        state['vectors'] = None
+        state['_uuid2row'] = None
+        return state
+
+    def update(self, removed_uuids, added_uuids, added_vectors, data_hash=None):
+        """Returns new embeddings without questions with removed_uuids and with added questions (vectors of the other
+        questions are kept as they are)"""
+        keep = ~np.isin(self.uuids, list(removed_uuids))
+
+        uuids = list(self.uuids[keep]) + list(added_uuids)
+        vectors = np.vstack([np.asarray(self.vectors[keep]), np.asarray(added_vectors, dtype=np.float32)])
+
+        return QuestionEmbeddings(uuids, vectors, self.model, data_hash)
+
+    def get_rows(self, uuids):
+        """Returns positions in vectors of given uuids, or None if any of them is not embedded"""
+        if self._uuid2row is None:
+            self._uuid2row = dict((u, i) for i, u in enumerate(self.uuids))
+
+        rows = [self._uuid2row.get(u) for u in uuids]
+        if any(r is None for r in rows):
+            return None
+
+        return np.array(rows, dtype=int)
+
+    def get_vectors(self, uuids, dtype=np.float64):
+        """Returns len(uuids) x M matrix of vectors of given questions, or None if any of them is not embedded"""
+        rows = self.get_rows(uuids)
+        if rows is None:
+            return None
+
+        return np.asarray(self.vectors[rows], dtype=dtype)
@@ -0,0 +1,120 @@
+"""
+Process-wide cache of loaded models and other resources used by sims (word vectors, word frequencies, first principal
+components, stop words, stemmer, TF-IDF indices, fitted sim models, preprocessed texts). Each of them is loaded once per
+process - constructing a sim after that costs next to nothing. Cached resources are shared, so they must not be modified by their
+users (except for the preprocessing cache, which is meant to be filled by them).
+
+Call invalidate() after re-generating the underlying pickles (see generate_pickles.py), so they get reloaded.
+"""
+
+import functools
+import threading
+import nltk
+import qsim.qsim_common as qsim
+
+
+WORD_VECTORS = 'word-vectors'
+WORD_FREQUENCIES = 'word-frequencies'
+FIRST_PC = 'first-pc'
+STOP_WORDS = 'stop-words'
+STEMMER = 'stemmer'
+STEMS = 'stems'
+TFIDF_INDEX = 'tfidf-index'
+QUESTION_EMBEDDINGS = 'question-embeddings'
+ANN_INDEX = 'ann-index'
+PREPROCESSING_CACHE = 'preprocessing-cache'
+SIM_MODEL = 'sim-model'
+
+# max number of words whose stems are remembered
+STEM_CACHE_SIZE = 2 ** 18
+
+
+_cache = {}
+_lock = threading.RLock()
+
+
+def get_resource(kind, loader, *options):
+    """Returns resource identified by kind and options, calling loader(*options) only if it's not cached yet"""
+    key = (kind,) + options
+
+    with _lock:
+        if key not in _cache:
+            _cache[key] = loader(*options)
+
+        return _cache[key]
+
+
+def invalidate(kind=None):
+    """Drops cached resources of given kind (all of them if kind is None)"""
+    with _lock:
+        for key in [k for k in _cache if kind is None or k[0] == kind]:
+            del _cache[key]
+
+
+def get_cached_keys():
+    with _lock:
+        return list(_cache.keys())
+
+
+# --- resources -----------------------------------------------------------
+
+
+def get_word_vectors(model_name):
+    return get_resource(WORD_VECTORS, qsim.load_word_vectors, model_name)
+
+
+def _load_word_frequencies(name, rem_stopwords):
+    wf_dict = qsim.load_word_frequencies_dict(name)
+
+    if rem_stopwords:
+        sws = get_stop_words()
+        wf_dict = dict((w, f) for w, f in wf_dict.items() if w not in sws)
+
+    return wf_dict
+
+
+def get_word_frequencies(name=qsim.DEF_WF_DICT_NAME, rem_stopwords=False):
+    return get_resource(WORD_FREQUENCIES, _load_word_frequencies, name, rem_stopwords)
+
+
+def get_1st_pc(model_name, rem_stopwords):
+    return get_resource(FIRST_PC, qsim.load_1st_pc, model_name, rem_stopwords)
+
+
+def get_stop_words():
+    return get_resource(STOP_WORDS, qsim.get_stop_words)
+
+
+def get_stemmer():
+    return get_resource(STEMMER, nltk.stem.PorterStemmer)
+
+
+def _create_memoised_stem():
+    return functools.lru_cache(maxsize=STEM_CACHE_SIZE)(get_stemmer().stem)
+
+
+def get_memoised_stem():
+    """Returns stemmer's stem function remembering stems of already seen words (the vocabulary is small, while
+    stemming is slow)"""
+    return get_resource(STEMS, _create_memoised_stem)
+
+
+def get_tfidf_index(name):
+    return get_resource(TFIDF_INDEX, qsim.load_tfidf_index, name)
+
+
+def get_question_embeddings(name):
+    return get_resource(QUESTION_EMBEDDINGS, qsim.load_question_embeddings, name)
+
+
+def get_ann_index(name):
+    return get_resource(ANN_INDEX, qsim.load_ann_index, name)
+
+
+def get_sim_model(name):
+    return get_resource(SIM_MODEL, qsim.load_sim_model, name)
+
+
+def get_preprocessing_cache():
+    """Unlike the other resources, the cache is modified by its users - it's thread-safe"""
+    return get_resource(PREPROCESSING_CACHE, qsim.load_preprocessing_cache)
@@ -4,10 +4,10 @@ import numpy as np
 import support.bokeh_helper as bh
 from bs4 import BeautifulSoup
 import random
-import qsim.qsim_common as qsim
 import pandas as pd
 import re
 from qsim.sims.tfidf_cos_sim import TfidfCosSim
+from qsim.survey_index import SurveyIndex
 
 
 COMP_TBL_FIELDS = ['question X', 'question Y', 'similarity']
@@ -26,17 +26,15 @@ def get_sample_comp_questions(
         max_val=1,
         count=3):
 
-    cs_matrix = qsim.get_cross_survey_matrix(sample_df) if cs_only else np.full(sim_matrix.shape, True)
-    not_itself_matrix = ~np.identity(len(sim_matrix), bool)
+    xs, ys = np.nonzero((min_val <= sim_matrix) & (sim_matrix <= max_val))
 
-    candidates = np.where(
-        (not_itself_matrix) &
-        (cs_matrix) &
-        (min_val <= sim_matrix) &
-        (sim_matrix <= max_val)
-    )
+    not_itself = xs != ys
+    xs, ys = xs[not_itself], ys[not_itself]
+
+    if cs_only:
+        xs, ys = SurveyIndex.from_df(sample_df).get_cross_survey_pairs(xs, ys)
 
-    candidates = list(zip(list(candidates[0]), list(candidates[1])))
+    candidates = list(zip(list(xs), list(ys)))
 
     if len(candidates) > count:
         candidates = random.sample(candidates, count)
@@ -82,26 +80,30 @@ def get_sample_comp_questions_spectrum(
     return q_pairs
 
 
-def get_sample_comp_df(sim, q_pair, displayed_cols=None, sim_cols=None):
-    qx, qy = q_pair['qx'], q_pair['qy']
+def get_sample_comp_dfs(sim, q_pairs, displayed_cols=None, sim_cols=None):
+    if len(q_pairs) == 0:
+        return []
 
     if displayed_cols is None:
-        displayed_cols = qx.index
+        displayed_cols = q_pairs[0]['qx'].index
 
     if sim_cols is None:
         sim_cols = displayed_cols
 
-    col2doc_sim = [(c, sim.get_text_sim) for c in sim_cols]
-
-    comp_df = create_comp_df(
-        qx, qy,
+    comp_dfs = create_comp_dfs(
+        [(q_pair['qx'], q_pair['qy']) for q_pair in q_pairs],
         displayed_cols=displayed_cols,
-        col2doc_sim=dict(col2doc_sim)
+        col2sim=dict((c, sim) for c in sim_cols)
     )
 
-    comp_df.meta = q_pair
+    for comp_df, q_pair in zip(comp_dfs, q_pairs):
+        comp_df.meta = q_pair
 
-    return comp_df
+    return comp_dfs
+
+
+def get_sample_comp_df(sim, q_pair, displayed_cols=None, sim_cols=None):
+    return get_sample_comp_dfs(sim, [q_pair], displayed_cols, sim_cols)[0]
 
 
 def get_comp_div(comp_df, palette=bh.DEF_PALETTE, width=bh.DEF_WIDTH):
@@ -119,7 +121,12 @@ def get_comp_div(comp_df, palette=bh.DEF_PALETTE, width=bh.DEF_WIDTH):
     return comp_div
 
 
-def create_comp_df(qx, qy, displayed_cols=None, col2doc_sim=None, def_sim=TfidfCosSim()):
+def create_comp_dfs(q_pairs, displayed_cols=None, col2sim=None, def_sim=TfidfCosSim()):
+    """Creates comparison tables for pairs of questions [(qx, qy), ...]
+
+    :param col2sim: dict column -> sim used to score the column (def_sim for all displayed columns by default). Each
+    sim scores its columns of all the pairs at once
+    """
     def _create_series(q):
         q['uuid'] = q.name
 
@@ -127,43 +134,60 @@ def create_comp_df(qx, qy, displayed_cols=None, col2doc_sim=None, def_sim=TfidfC
 
         return q
 
+    if len(q_pairs) == 0:
+        return []
+
     if displayed_cols is None:
-        displayed_cols = ['uuid'] + list(qx.index)
+        displayed_cols = ['uuid'] + list(q_pairs[0][0].index)
+
+    q_pairs = [(_create_series(qx), _create_series(qy)) for qx, qy in q_pairs]
 
-    qx = _create_series(qx)
-    qy = _create_series(qy)
+    if col2sim is None:
+        col2sim = dict((c, def_sim) for c in displayed_cols)
 
-    if col2doc_sim is None:
-        col2doc_sim = dict((c, def_sim.get_text_sim) for c in displayed_cols)
+    sim_cols = [c for c in col2sim if c in displayed_cols]
 
-    sim_col = pd.Series([''] * len(qx), index=displayed_cols)
+    # (pair position, column) -> similarity
+    similarities = {}
+    sims = []
+    for c in sim_cols:
+        if not any(col2sim[c] is sim for sim in sims):
+            sims.append(col2sim[c])
 
-    for c in col2doc_sim:
-        if c not in displayed_cols:
-            continue
-        similarity = col2doc_sim[c](str(qx.loc[c]), str(qy.loc[c]))
-        if similarity is not None:
-            sim_col.loc[c] = similarity
+    for sim in sims:
+        cols = [c for c in sim_cols if col2sim[c] is sim]
+        keys = [(i, c) for i in range(len(q_pairs)) for c in cols]
 
-    df = pd.concat([qx, qy, sim_col], axis=1, ignore_index=True)
-    df.columns = COMP_TBL_FIELDS
+        scores = sim.score_pairs([(str(q_pairs[i][0].loc[c]), str(q_pairs[i][1].loc[c])) for i, c in keys])
+        similarities.update(zip(keys, scores))
 
-    return df
+    dfs = []
+    for i, (qx, qy) in enumerate(q_pairs):
+        sim_col = pd.Series([''] * len(qx), index=displayed_cols, dtype=object)
+
+        for c in sim_cols:
+            if pd.notnull(similarities[i, c]):
+                sim_col.loc[c] = similarities[i, c]
+
+        df = pd.concat([qx, qy, sim_col], axis=1, ignore_index=True)
+        df.columns = COMP_TBL_FIELDS
+        dfs.append(df)
+
+    return dfs
+
+
+def create_comp_df(qx, qy, displayed_cols=None, col2sim=None, def_sim=TfidfCosSim()):
+    return create_comp_dfs([(qx, qy)], displayed_cols, col2sim, def_sim)[0]
 
 
 def get_comp_divs(df, sim, displayed_cols=DEF_DISPLAYED_COLS, sim_cols=None, width=bh.DEF_WIDTH, **spectrum_kwargs):
     q_pairs = get_sample_comp_questions_spectrum(df, sim, **spectrum_kwargs)
 
-    comp_divs = []
-
     d_cols = displayed_cols + [c for c in sim_cols if c not in displayed_cols]
 
-    for q_pair in q_pairs:
-        comp_df = get_sample_comp_df(sim, q_pair, displayed_cols=d_cols, sim_cols=sim_cols)
-        comp_div = get_comp_div(comp_df, width=width)
-        comp_divs.append(comp_div)
+    comp_dfs = get_sample_comp_dfs(sim, q_pairs, displayed_cols=d_cols, sim_cols=sim_cols)
 
-    return comp_divs
+    return [get_comp_div(comp_df, width=width) for comp_df in comp_dfs]
 
 
 def get_df_html_with_similarities_colored(df, similarity_col=COMP_TBL_FIELDS[-1], palette=bh.DEF_PALETTE):
@@ -220,12 +244,16 @@ def get_sim_bar_chart_df(df, sim, bars=10, sample_size=50, cs_only=False):
     if sample_size < len(sdf):
         sdf = df.sample(sample_size)
 
-    sim_matrix = sim.get_similarity_matrix(sdf, cs_only=cs_only)
-    n = sim_matrix.shape[0]
+    sdf = sdf.reset_index()
 
-    top_indices = [(i // n, i % n) for i in sim_matrix.argsort(axis=None)][::-1]
+    # top k of each question is enough to find the overall top pairs (symmetric pairs are counted only once)
+    top_pairs = {}
+    for i in range(len(sdf)):
+        top_df = sim.get_top_k(sdf, i, k=bars, cs_only=cs_only)
+        for j, similarity in zip(top_df.index, top_df['similarity']):
+            top_pairs[(min(i, j), max(i, j))] = similarity
 
-    sdf = sdf.reset_index()
+    top_indices = sorted(top_pairs, key=top_pairs.get, reverse=True)
 
     rows = []
     for ti in top_indices[:bars]:
@@ -238,12 +266,10 @@ def get_sim_bar_chart_df(df, sim, bars=10, sample_size=50, cs_only=False):
 
         row = row.append(_get_q(ti[0], 'x'))
         row = row.append(_get_q(ti[1], 'y'))
-        row['similarity'] = sim_matrix[ti[0], ti[1]]
+        row['similarity'] = top_pairs[ti]
         rows.append(row)
 
     bc_df = pd.DataFrame(rows)
-    if cs_only:
-        bc_df = bc_df[bc_df.apply(lambda row: row['survey_id_x'] != row['survey_id_y'], axis=1)]
 
     return bc_df
 
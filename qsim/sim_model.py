@@ -0,0 +1,28 @@
+"""
+A fitted model of a sim (see BaseSim.fit) - e.g. TF-IDF index, IDFs of words or first principal component. It is
+fitted once (e.g. by a batch job, see generate_pickles.py), pickled to CHECKPT_DIR and then loaded by sims in other
+processes (e.g. dashboard workers), which apply it to new texts without fitting anything per request.
+
+Class and options of the sim the model was fitted by are stored along with it, so that it isn't loaded by a differently
+configured sim
+"""
+
+import datetime
+
+
+class SimModel:
+    # increase whenever the pickled structure changes, so that outdated pickles are detected
+    VERSION = 1
+
+    def __init__(self, sim_class_name, options, model, data_hash=None):
+        """
+        :param options: options of the sim the model depends on (see BaseSim._get_model_options)
+        :param model: the fitted model itself - sim specific, None for sims with nothing to fit
+        """
+        self.version = self.VERSION
+        self.created = datetime.datetime.now()
+        self.data_hash = data_hash
+
+        self.sim_class_name = sim_class_name
+        self.options = options
+        self.model = model
@@ -1,43 +1,68 @@
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
 from support.common import *
 from qsim.sims.embeddings_based_sim import EmbeddingsBasedSim
 from qsim.qsim_common import W2vModelName
+import qsim.qsim_common as qsim
 
 
 class AvgWordVecSim(EmbeddingsBasedSim):
     DEF_COLS = ['suff_qtext', 'type']
 
-    def __init__(self, cols=DEF_COLS, debug=False, wv_dict_model_name=W2vModelName.PretrainedGoogleNews, rem_stopwords=True):
-        super().__init__(cols, debug, wv_dict_model_name, rem_stopwords)
+    def __init__(self, cols=DEF_COLS, debug=False, wv_dict_model_name=W2vModelName.PretrainedGoogleNews, rem_stopwords=True,
+                 data_hash=None, preprocessing_n_jobs=1, dtype=np.float64):
+        super().__init__(cols, debug, wv_dict_model_name, rem_stopwords, data_hash, preprocessing_n_jobs, dtype)
 
-    def _get_similarity_matrix_from_texts(self, proc_texts):
+        self._count_vectorizer = None
+
+    def _get_question_vecs(self, proc_texts, model=None):
         # N = # of items
         # V = # of vocab words
         # M = dimensionality of vector space
 
-        # create TF-IDF matrix - one row per question (N x V)
-        tfidf_vectorizer = TfidfVectorizer()
-        tfidf_matrix = tfidf_vectorizer.fit_transform(proc_texts).toarray()
-
-        # get features (words)
-        features = tfidf_vectorizer.get_feature_names()
+        # create TF-IDF matrix - one row per question (N x V, sparse). Words are counted over the (fixed) word vectors
+        # vocabulary, so columns are rows of the word vectors matrix. Only IDFs are fitted on proc_texts
+        count_matrix = self._get_word_counts(proc_texts)
 
-        # now make word vector for each feature -> a V x M matrix - one row (word vec) per feature
-        wvs_matrix = np.array([self._wv_dict[f] for f in features])
+        tfidf_transformer = model
+        if tfidf_transformer is None:
+            tfidf_transformer = TfidfTransformer().fit(count_matrix)
+        tfidf_matrix = tfidf_transformer.transform(count_matrix)
 
-        # multiply the two matrices to get a matrix N x M
+        # multiply by the V x M word vectors matrix to get a matrix N x M
         # - each row is a (tf-idf) scaled sum of the word vectors for words of the question
-        sumwv_matrix = np.matrix.dot(tfidf_matrix, wvs_matrix)
+        sumwv_matrix = self._get_weighted_wv_sums(tfidf_matrix)
+
+        # now normalize using the sum of tf-idfs for the question's words
+        sumtfidf_vec = np.asarray(tfidf_matrix.sum(axis=1)).ravel()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avgwv_matrix = sumwv_matrix / sumtfidf_vec[:, np.newaxis]
+
+        return tfidf_transformer, avgwv_matrix
+
+    def _get_word_counts(self, proc_texts):
+        """Sparse N x V matrix of counts of words (of the word vectors' vocabulary) in the texts - tokenized the same
+        way TfidfVectorizer does it"""
+        if self._count_vectorizer is None:
+            self._count_vectorizer = CountVectorizer(vocabulary=self._wv_dict.vocabulary)
+
+        return self._count_vectorizer.transform(proc_texts)
+
+    def _get_pair_sims(self, proc_texts, xs, ys):
+        if self._model is not None:
+            return self._get_fitted_pair_sims(proc_texts, xs, ys)
+
+        # the same as fitting TF-IDF on each pair separately (see _get_text_sim). Scaling of the TF-IDF vectors
+        # (normalisation, averaging) doesn't change cosine similarities, so it's left out
+        count_matrix = self._get_word_counts(proc_texts)
+
+        tfidf_x, tfidf_y = qsim.get_pairwise_tfidf(count_matrix, xs, ys)
+        sims = qsim.get_rowwise_cos_sims(self._get_weighted_wv_sums(tfidf_x), self._get_weighted_wv_sums(tfidf_y))
 
-        # now normalize using the sum oprf tf-idfs for the question's words
-        sumtfidf_vec = tfidf_matrix.sum(axis=1)
-        avgwv_matrix = sumwv_matrix / sumtfidf_vec[:, np.newaxis]
+        # average of no word vectors is undefined
+        sims[(tfidf_x.getnnz(axis=1) == 0) | (tfidf_y.getnnz(axis=1) == 0)] = np.nan
 
-        # finally, cosine similarity on this
-        csm = cosine_similarity(avgwv_matrix, avgwv_matrix)
-        return csm
+        return sims
 
 
 
@@ -1,24 +1,309 @@
+import hashlib
 import logging
 import support.log_helper as lg
 import qsim.qsim_common as qsim
+import qsim.resources as resources
+import qsim.parallel as parallel
+from qsim.symmetric_matrix import SymmetricMatrix
+from qsim.survey_index import SurveyIndex
+from qsim.sim_model import SimModel
 import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+
+
+OUTPUT_DENSE = 'dense'
+OUTPUT_SPARSE = 'sparse'
+OUTPUT_EDGES = 'edges'
+
+# number of texts preprocessed by a single task, when preprocessing in parallel
+PREPROCESSING_CHUNK_SIZE = 2000
+
+
+def _preprocess_chunk_in_worker(chunk):
+    start, end = chunk
+    sim = parallel.get_inherited('sim')
+
+    return [sim._preprocess_text_uncached(t) for t in parallel.get_inherited('texts')[start:end]]
 
 
 class BaseSim:
-    def __init__(self, cols, debug):
+    # memory ceiling for blocked computation of similarity matrices
+    DEF_MAX_MEMORY_MB = 512
+
+    # rough upper estimate of bytes needed per cell of a block of rows - the float64 block itself plus temporaries
+    # (e.g. cross-survey mask or scaling) created while computing it
+    BLOCK_BYTES_PER_CELL = 32
+
+    # separator of values of multiple columns joined into a single text, and whether null values are left out
+    COL_SEP = ' '
+    SKIP_NULL_COLS = True
+
+    def __init__(self, cols, debug, preprocessing_n_jobs=1, dtype=np.float64):
+        """
+        :param preprocessing_n_jobs: number of processes batches of texts (e.g. whole df) are preprocessed in - 1 =
+        no parallelism, None = all CPUs
+        :param dtype: float dtype similarities are computed and returned in. np.float32 halves memory and speeds up
+        the matrix products, at the cost of precision (similarities differ by up to ~1e-6)
+        """
         self._debug = debug
         self._lg = lg.get_logger(str(self.__class__.__name__))
         if not debug:
             self._lg.setLevel(logging.WARNING)
 
         self._cols = cols
+        self._preprocessing_n_jobs = preprocessing_n_jobs
+        self._dtype = np.dtype(dtype)
+
+        self._model = None
+        self._model_data_hash = None
+        self._fitted = False
+
+        self._index_key = None
+        self._index = None
 
     def _get_text_sim(self, x, y):
         raise NotImplementedError
 
+    def _get_pair_sims(self, proc_texts, xs, ys):
+        """Returns similarities of pairs of preprocessed texts (proc_texts[xs[i]], proc_texts[ys[i]]) - the same values
+        _get_text_sim gives for the original texts (NaN where it fails)"""
+        raise NotImplementedError
+
     def _get_similarity_matrix(self, df):
+        """Returns similarity matrix of questions in df - either as a SymmetricMatrix (preferably, so that only a half
+        of the pairs has to be computed), or as a N x N numpy array"""
+        raise NotImplementedError
+
+    def _preprocess_df(self, df):
+        """Returns array of preprocessed texts of questions in df (values of self._cols joined by COL_SEP)"""
+        return self._preprocess_texts(self._join_cols(df))
+
+    def _join_cols(self, df):
+        """Joins values of self._cols (all columns if None) of each question in df by COL_SEP (nulls are left out if
+        SKIP_NULL_COLS) - column by column rather than row by row"""
+        cols = self._cols if self._cols is not None else list(df.columns)
+
+        # every value is prefixed by the separator, the leading one is cut off at the end
+        joined = np.full(len(df), '', dtype=object)
+        for col in cols:
+            values = df[col].to_numpy(dtype=object)
+            strs = self.COL_SEP + np.array(list(map(str, values)), dtype=object)
+
+            if self.SKIP_NULL_COLS:
+                strs = np.where(pd.notnull(values), strs, '')
+
+            joined = joined + strs
+
+        return [text[len(self.COL_SEP):] for text in joined]
+
+    def _preprocess_texts(self, texts):
+        """Preprocesses a batch of texts - each distinct one only once (and only if it's not in the preprocessing
+        cache yet)"""
+        if len(texts) == 0:
+            return np.array([])
+
+        codes, uniques = pd.factorize(np.array(texts, dtype=object))
+        uniques = list(uniques)
+
+        key = self._get_preprocessing_key()
+        if key is None:
+            proc_uniques = self._preprocess_many(uniques)
+        else:
+            proc_uniques = resources.get_preprocessing_cache().get_many(key, uniques, self._preprocess_many)
+
+        return np.array(proc_uniques)[codes]
+
+    def _preprocess_many(self, texts):
+        """Preprocesses texts (bypassing the cache) - in chunks in parallel, if preprocessing_n_jobs allows it"""
+        if self._preprocessing_n_jobs == 1 or len(texts) <= PREPROCESSING_CHUNK_SIZE:
+            return [self._preprocess_text_uncached(t) for t in texts]
+
+        chunks = [(start, min(start + PREPROCESSING_CHUNK_SIZE, len(texts)))
+                  for start in range(0, len(texts), PREPROCESSING_CHUNK_SIZE)]
+        self._lg.debug('preprocessing {} texts in {} chunks'.format(len(texts), len(chunks)))
+
+        results = parallel.run_in_pool(_preprocess_chunk_in_worker, chunks, self._preprocessing_n_jobs,
+                                       inherited={'sim': self, 'texts': texts})
+
+        return [proc_text for result in results for proc_text in result]
+
+    def _preprocess_text_uncached(self, text):
+        raise NotImplementedError
+
+    def _get_preprocessing_key(self):
+        """Returns hashable key of the options _preprocess_text_uncached depends on - sims preprocessing texts the same
+        way share entries of the preprocessing cache. None = results are not cached"""
+        return None
+
+    def _preprocess_text(self, text):
+        """Returns preprocessed text - each distinct text is preprocessed only once (see PreprocessingCache)"""
+        key = self._get_preprocessing_key()
+        if key is None:
+            return self._preprocess_text_uncached(text)
+
+        return resources.get_preprocessing_cache().get(key, text, self._preprocess_text_uncached)
+
+    # --- fitted model -----------------------------------------------------------
+
+    # A model is what a sim learns from a set of questions (e.g. TF-IDF index, IDFs of words or first PC). Once fitted
+    # (see fit) or loaded (see load), it's applied to all questions and texts the sim scores, so nothing is fitted per
+    # request. Sims without a fitted model fit it on the compared questions themselves
+
+    def _fit_model(self, df):
+        """Returns model fitted on questions of df. None = the sim has nothing to fit"""
+        return None
+
+    def _transform(self, proc_texts):
+        """Returns representation of preprocessed texts the sim scores (e.g. matrix of their vectors, one row per
+        text), using the fitted model. By default it's the texts themselves"""
+        return np.asarray(proc_texts, dtype=object)
+
+    def _get_model_options(self):
+        """Returns options the fitted model depends on - a saved model is loaded only by sims with the same options"""
+        return self._cols, self._get_preprocessing_key()
+
+    def _set_model(self, model, data_hash=None):
+        self._model = model
+        self._model_data_hash = data_hash
+        self._fitted = True
+
+        # the last index may have been created by a different model
+        self._index_key = None
+        self._index = None
+
+    def _check_fitted(self):
+        if not self._fitted:
+            raise ValueError('{} is not fitted - call fit or load first'.format(self.__class__.__name__))
+
+    def is_fitted(self):
+        return self._fitted
+
+    def fit(self, df):
+        """Fits the sim's model on questions of df (e.g. the whole question bank). Returns self"""
+        self._set_model(self._fit_model(df))
+
+        return self
+
+    def transform(self, texts):
+        """Returns representation of texts under the fitted model (see _transform)"""
+        self._check_fitted()
+
+        return self._transform(self._preprocess_texts(list(texts)))
+
+    def get_model_name(self):
+        """Default name the fitted model is saved under - unique for the sim's class and options"""
+        options_hash = hashlib.md5(repr(self._get_model_options()).encode('utf-8')).hexdigest()
+
+        return '{}.{}'.format(self.__class__.__name__, options_hash[:12])
+
+    def save(self, name=None, data_hash=None):
+        """Persists the fitted model to CHECKPT_DIR, so that sims in other processes can load it
+
+        :param data_hash: hash of the data file (see get_file_hash) the model was fitted on, if any
+        """
+        self._check_fitted()
+
+        sim_model = SimModel(self.__class__.__name__, self._get_model_options(), self._model, data_hash)
+        qsim.pickle_sim_model(sim_model, name or self.get_model_name())
+        resources.invalidate(resources.SIM_MODEL)
+
+    def has_saved_model(self, name=None, data_hash=None):
+        """Whether a model is saved under name (and was fitted on data with data_hash, if given)"""
+        name = name or self.get_model_name()
+        if not qsim.sim_model_exists(name):
+            return False
+
+        return data_hash is None or resources.get_sim_model(name).data_hash == data_hash
+
+    def load(self, name=None):
+        """Loads model saved by a sim of the same class and options (see save) and uses it from now on. Returns self"""
+        name = name or self.get_model_name()
+        sim_model = resources.get_sim_model(name)
+
+        if sim_model.version != SimModel.VERSION:
+            raise ValueError('Sim model {} is outdated (version {}, expected {}). Re-generate it via '
+                             'generate_pickles'.format(name, sim_model.version, SimModel.VERSION))
+
+        if sim_model.sim_class_name != self.__class__.__name__ or sim_model.options != self._get_model_options():
+            raise ValueError('Sim model {} was fitted by {} with options {}, not by {} with options {}'.format(
+                name, sim_model.sim_class_name, sim_model.options, self.__class__.__name__,
+                self._get_model_options()))
+
+        self._set_model(sim_model.model, sim_model.data_hash)
+
+        return self
+
+    # --- index -----------------------------------------------------------
+
+    # An index is a sim-specific, pre-built representation of a set of questions (e.g. preprocessed texts, TF-IDF
+    # or sentence vectors) that allows scoring a single question against all of them without computing
+    # the whole N x N similarity matrix
+
+    def _create_index(self, proc_texts):
+        raise NotImplementedError
+
+    def _get_index_sims(self, index, rows):
+        """Returns similarities of the indexed items at positions `rows` to all indexed items (len(rows) x N matrix)"""
+        raise NotImplementedError
+
+    def _get_index_text_sims(self, index, proc_text):
+        """Returns similarities of a (preprocessed) text to all indexed items (vector of N)"""
         raise NotImplementedError
 
+    def _create_df_index(self, df):
+        return self._create_index(self._preprocess_df(df))
+
+    def _get_index_key(self, df):
+        cols = self._cols if self._cols is not None else list(df.columns)
+        return hashlib.md5(pd.util.hash_pandas_object(df[cols]).values.tobytes()).hexdigest()
+
+    def get_index(self, df):
+        """Returns index for given df. The last created index is kept, so repeated queries on the same df are cheap"""
+        key = self._get_index_key(df)
+
+        if self._index_key != key:
+            self._index = self._create_df_index(df)
+            self._index_key = key
+
+        return self._index
+
+    def score_text_against(self, df, text):
+        """Returns similarities of the text to each question in df (vector of len(df)) on the scale of get_text_sim (not
+        of the similarity matrix, which may be rescaled - see EmbeddingsBasedSim), NaN if the text is empty. The
+        questions are preprocessed and indexed only once (see get_index) and the text is preprocessed once, so scoring
+        many texts against the same df is cheap"""
+        if pd.isnull(text) or text == '':
+            return np.full(len(df), np.nan, dtype=self._dtype)
+
+        return np.array(self._get_index_text_sims(self.get_index(df), self._preprocess_text(text)), dtype=self._dtype)
+
+    def get_top_k(self, df, query, k=10, cs_only=False):
+        """Returns up to k questions from df most similar to the query, ordered by similarity
+
+        :param query: either position of a question in df (the question itself is excluded from results, similarities
+        are those of the similarity matrix), or a text (similarities are those of score_text_against)
+        :param cs_only: if True (and query is a position), only questions from other surveys are returned
+        :return: copy of the relevant rows of df with an added 'similarity' column
+        """
+        if isinstance(query, str):
+            sims = self.score_text_against(df, query)
+        else:
+            sims = np.array(self._get_index_sims(self.get_index(df), [query])[0], dtype=self._dtype)
+            sims[query] = np.nan
+
+            if cs_only:
+                sims[SurveyIndex.from_df(df).get_same_survey_mask(query)] = np.nan
+
+        top_indices = qsim.get_top_k_indices(sims, k)
+
+        top_df = df.iloc[top_indices].copy()
+        top_df['similarity'] = sims[top_indices]
+
+        return top_df
+
+    # --- public interface -----------------------------------------------------------
+
     def get_text_sim(self, x, y):
         if pd.isnull(x) or pd.isnull(y) or x == '' or y == '':
             return None
@@ -28,6 +313,32 @@ class BaseSim:
         except:
             return None
 
+    def score_pairs(self, pairs):
+        """Returns similarities of pairs of texts (x, y) - vector of the same values as get_text_sim(x, y) gives, NaN
+        where it gives None. Each unique text is preprocessed only once and all pairs are scored at once"""
+        pairs = list(pairs)
+        sims = np.full(len(pairs), np.nan, dtype=self._dtype)
+
+        valid = np.array([not (pd.isnull(x) or pd.isnull(y) or x == '' or y == '') for x, y in pairs], dtype=bool)
+        if not valid.any():
+            return sims
+
+        valid_pairs = [p for p, v in zip(pairs, valid) if v]
+        codes, texts = pd.factorize(np.array([x for x, _ in valid_pairs] + [y for _, y in valid_pairs], dtype=object))
+        proc_texts = np.array(self._preprocess_texts(texts), dtype=object)
+
+        xs, ys = codes[:len(valid_pairs)], codes[len(valid_pairs):]
+        sims[valid] = self._get_pair_sims(proc_texts, xs, ys)
+
+        return sims
+
+    def precompute_preprocessing(self, df, cols=()):
+        """Fills the preprocessing cache with preprocessed questions of df and values of given (single) columns"""
+        self._preprocess_df(df)
+
+        for col in cols:
+            self._preprocess_texts([str(text) for text in df[col].dropna().unique()])
+
     def get_question_sim(self, qx, qy):
         x = self.preprocess_question(qx)
         y = self.preprocess_question(qy)
@@ -37,11 +348,129 @@ class BaseSim:
     def preprocess_question(self, question_series):
         raise NotImplementedError
 
-    def get_similarity_matrix(self, df, cs_only=False):
-        sim_matrix = self._get_similarity_matrix(df)
+    def get_similarity_matrix(self, df, cs_only=False, min_sim=None, output=OUTPUT_DENSE):
+        """Returns similarities of all pairs of questions in df
 
+        :param cs_only: if True, similarities of questions from the same survey are set to 0 (dropped if sparse)
+        :param min_sim: if given, similarities lower than this are set to 0 (dropped if sparse)
+        :param output: OUTPUT_DENSE (N x N numpy array), OUTPUT_SPARSE (scipy CSR matrix with only the non-zero
+        similarities - symmetric, including the diagonal) or OUTPUT_EDGES (DataFrame with uuid_x, uuid_y and
+        similarity - the entries of the sparse matrix above the diagonal, i.e. each pair of different questions once)
+        """
+        if output == OUTPUT_DENSE:
+            sim_matrix = self._get_similarity_matrix(df)
+            if isinstance(sim_matrix, SymmetricMatrix):
+                sim_matrix = sim_matrix.to_square()
+            sim_matrix = np.asarray(sim_matrix, dtype=self._dtype)
+
+            if cs_only:
+                SurveyIndex.from_df(df).wipe_same_survey(sim_matrix)
+
+            if min_sim is not None:
+                self._wipe_low_sims(sim_matrix, min_sim)
+
+            return sim_matrix
+
+        if output not in [OUTPUT_SPARSE, OUTPUT_EDGES]:
+            raise ValueError('Unknown output: {}'.format(output))
+
+        sim_matrix = self._get_sparse_similarity_matrix(df, min_sim).tocoo()
+
+        keep = sim_matrix.data != 0
         if cs_only:
-            cs_matrix = qsim.get_cross_survey_matrix(df)
-            sim_matrix[~cs_matrix] = 0
+            keep &= SurveyIndex.from_df(df).is_cross_survey(sim_matrix.row, sim_matrix.col)
+
+        sim_matrix = sp.csr_matrix(
+            (sim_matrix.data[keep], (sim_matrix.row[keep], sim_matrix.col[keep])),
+            shape=sim_matrix.shape
+        )
+
+        if output == OUTPUT_EDGES:
+            return self._get_edges_df(df, sim_matrix)
+
+        return sim_matrix
+
+    def _wipe_low_sims(self, sim_matrix, min_sim):
+        """Sets similarities lower than min_sim to 0, in place - block by block of rows, so the mask stays small"""
+        n = sim_matrix.shape[0]
+        block_size = self._get_block_size(max(n, 1), self.DEF_MAX_MEMORY_MB)
+
+        for start in range(0, n, block_size):
+            block = sim_matrix[start:start + block_size]
+            block[block < min_sim] = 0
+
+    def _get_sparse_similarity_matrix(self, df, min_sim):
+        """Default implementation - computes dense blocks of rows and keeps only similarities >= min_sim. Sims with a
+        natively sparse representation should override this"""
+        blocks = [self._to_sparse_block(block, min_sim, self._dtype) for _, block in self._iter_similarity_blocks(df)]
+
+        return sp.vstack(blocks, format='csr') if len(blocks) > 0 else sp.csr_matrix((0, 0))
+
+    def _to_sparse_block(self, block, min_sim, dtype=float):
+        if min_sim is None:
+            block[np.isnan(block)] = 0
+        else:
+            block[~(block >= min_sim)] = 0  # this also drops NaNs
+
+        return sp.csr_matrix(block, dtype=dtype)
+
+    def _get_edges_df(self, df, sim_matrix):
+        # the matrix is symmetric, so only the upper triangle is listed (without self-pairs)
+        sim_matrix = sp.triu(sim_matrix, k=1, format='coo')
+        uuids = np.array(df.index)
+
+        return pd.DataFrame({
+            'uuid_x': uuids[sim_matrix.row],
+            'uuid_y': uuids[sim_matrix.col],
+            'similarity': sim_matrix.data
+        }, columns=['uuid_x', 'uuid_y', 'similarity'])
+
+    def _get_block_size(self, n, max_memory_mb):
+        return max(1, int(max_memory_mb * 2**20 // (n * self.BLOCK_BYTES_PER_CELL)))
+
+    def _iter_similarity_blocks(self, df, max_memory_mb=DEF_MAX_MEMORY_MB):
+        """Yields (rows, block) - similarities of the questions at positions `rows` to all questions in df"""
+        n = len(df)
+        index = self.get_index(df)
+        block_size = self._get_block_size(n, max_memory_mb)
+
+        for start in range(0, n, block_size):
+            rows = np.arange(start, min(start + block_size, n))
+            self._lg.debug('block {}-{}/{}'.format(rows[0], rows[-1], n))
+
+            yield rows, np.asarray(self._get_index_sims(index, rows), dtype=self._dtype)
+
+    def get_similarity_matrix_blocked(self, df, fpath, cs_only=False, min_sim=None, max_memory_mb=DEF_MAX_MEMORY_MB):
+        """Computes the similarity matrix block by block (a few rows at a time) and streams it to disk, so that the
+        whole matrix never has to fit in memory. Memory used on top of the index is bounded by max_memory_mb
+
+        :param fpath: where to store the result. If min_sim is None, it's a memory-mapped float32 .npy file, otherwise
+        a sparse CSR matrix containing only similarities >= min_sim, stored via scipy.sparse.save_npz
+        :return: the result, memory-mapped read only (dense) or loaded (sparse)
+        """
+        n = len(df)
+        survey_index = SurveyIndex.from_df(df) if cs_only else None
+
+        dense = None
+        sparse_blocks = []
+        if min_sim is None:
+            dense = np.lib.format.open_memmap(fpath, mode='w+', dtype=np.float32, shape=(n, n))
+
+        for rows, block in self._iter_similarity_blocks(df, max_memory_mb):
+            if cs_only:
+                survey_index.wipe_same_survey_block(block, rows)
+
+            if dense is not None:
+                dense[rows] = block
+            else:
+                sparse_blocks.append(self._to_sparse_block(block, min_sim, dtype=np.float32))
+
+        if dense is not None:
+            dense.flush()
+            del dense
+            return np.load(fpath, mmap_mode='r')
+
+        sim_matrix = sp.vstack(sparse_blocks, format='csr') if n > 0 else sp.csr_matrix((0, 0), dtype=np.float32)
+        sp.save_npz(fpath, sim_matrix)
 
-        return sim_matrix
\ No newline at end of file
+        return sim_matrix
@@ -1,34 +1,165 @@
+import hashlib
 import numpy as np
+import scipy.sparse as sp
 import qsim.qsim_common as qsim
+import qsim.resources as resources
 from support.common import *
 from qsim.sims.base_sim import BaseSim
+from qsim.symmetric_matrix import SymmetricMatrix
+from qsim.question_embeddings import QuestionEmbeddings
+from qsim.ann_index import IvfIndex, DEF_NPROBE
 
 
-class EmbeddingsBasedSim(BaseSim):
-    def __init__(self, cols, debug, wv_dict_model_name, rem_stopwords):
-        super().__init__(cols, debug)
+def _exp_scale_in_place(sims):
+    return qsim.exp_scale(sims, out=sims)
+
 
-        self._wv_dict = qsim.load_word_vectors(wv_dict_model_name)
+class EmbeddingsBasedSim(BaseSim):
+    def __init__(self, cols, debug, wv_dict_model_name, rem_stopwords, data_hash=None, preprocessing_n_jobs=1,
+                 dtype=np.float64):
+        """
+        :param data_hash: hash of the data file (see get_file_hash) questions come from. If given, precomputed question
+        embeddings for that data (see generate_pickles) are used, when available
+        """
+        super().__init__(cols, debug, preprocessing_n_jobs, dtype)
+
+        self._wv_dict_model_name = wv_dict_model_name
+        self._wv_dict = resources.get_word_vectors(wv_dict_model_name)
         self._rem_stopwords = rem_stopwords
-        self._sws = qsim.get_stop_words()
+        self._sws = resources.get_stop_words()
+        self._data_hash = data_hash
+
+    # --- precomputed question embeddings -----------------------------------------------------------
+
+    def get_question_embeddings_name(self, data_hash):
+        """Name of precomputed question embeddings of the data - unique for the sim's class and the options they depend
+        on (see _get_question_embeddings_options)"""
+        options_hash = hashlib.md5(repr(self._get_question_embeddings_options()).encode('utf-8')).hexdigest()
+
+        return '.'.join([self.__class__.__name__, options_hash[:12], data_hash])
+
+    def _get_question_embeddings_options(self):
+        """Returns options question vectors depend on, when they are computed without a fitted model (as precomputed
+        question embeddings are) - by default the same as the model's"""
+        return self._get_model_options()
 
+    def create_question_embeddings(self, df, data_hash=None):
+        model, vecs = self._get_unit_question_vecs(self._preprocess_df(df))
+
+        return QuestionEmbeddings(df.index, vecs.astype(np.float32), model, data_hash)
+
+    def update_question_embeddings(self, question_embeddings, added_df, removed_uuids, data_hash=None):
+        """Returns question_embeddings updated with added and removed questions. The added questions are embedded using
+        the existing model (e.g. TF-IDF vectorizer), which is not re-fitted"""
+        vecs = np.zeros((0, question_embeddings.vectors.shape[1]))
+        if len(added_df) > 0:
+            _, vecs = self._get_unit_question_vecs(self._preprocess_df(added_df), question_embeddings.model)
+
+        return question_embeddings.update(removed_uuids, added_df.index, vecs, data_hash)
+
+    def _load_question_embeddings(self):
+        if self._data_hash is None:
+            return None
+
+        name = self.get_question_embeddings_name(self._data_hash)
+        try:
+            question_embeddings = resources.get_question_embeddings(name)
+        except (IOError, OSError):
+            self._lg.debug('No precomputed question embeddings {} - computing them on the fly'.format(name))
+            return None
 
-    def _preprocess_df(self, df):
-        proc_texts = []
+        if question_embeddings.version != QuestionEmbeddings.VERSION:
+            raise ValueError('Question embeddings {} are outdated (version {}, expected {}). Re-generate them via '
+                             'generate_pickles'.format(name, question_embeddings.version, QuestionEmbeddings.VERSION))
 
-        cols = self._cols if self._cols is not None else list(df.columns)
-        for _, row in df.iterrows():
-            proc_texts.append(self._preprocess_question(row, cols))
+        return question_embeddings
 
-        return np.array(proc_texts)
+    def create_ann_index(self, question_embeddings, n_lists=None):
+        return IvfIndex.create(question_embeddings.vectors, question_embeddings.uuids, n_lists=n_lists,
+                               data_hash=question_embeddings.data_hash)
+
+    def _load_ann_index(self):
+        if self._data_hash is None:
+            return None
+
+        name = self.get_question_embeddings_name(self._data_hash)
+        try:
+            ann_index = resources.get_ann_index(name)
+        except (IOError, OSError):
+            self._lg.debug('No ANN index {}'.format(name))
+            return None
+
+        if ann_index.version != IvfIndex.VERSION:
+            raise ValueError('ANN index {} is outdated (version {}, expected {}). Re-generate it via '
+                             'generate_pickles'.format(name, ann_index.version, IvfIndex.VERSION))
+
+        return ann_index
+
+    def has_ann_index(self):
+        return self._load_ann_index() is not None
+
+    def search_question_bank(self, text, k=10, nprobe=DEF_NPROBE):
+        """Returns Series of similarities of (approximately) k questions of the whole question bank most similar to the
+        text (cosine similarities, on the scale of get_text_sim), indexed by their uuids and ordered by similarity. Uses
+        ANN index (see create_ann_index) of the data given by data_hash - more clusters probed (nprobe) mean better
+        recall, but slower search"""
+        ann_index = self._load_ann_index()
+        if ann_index is None:
+            raise ValueError('No ANN index available - sim has to be created with data_hash of data with generated '
+                             'question embeddings and ANN index')
+
+        question_embeddings = self._load_question_embeddings()
+        _, text_vecs = self._get_unit_question_vecs([self._preprocess_text(text)], question_embeddings.model)
+
+        uuids, sims = ann_index.search(text_vecs[0], k=k, nprobe=nprobe)
+
+        return pd.Series(sims, index=uuids)
+
+    def _get_precomputed_question_vecs(self, df):
+        """Returns (model, unit question vectors) of questions in df from precomputed embeddings, or None if they are
+        not available for all of them (or the sim has a fitted model of other data)"""
+        if self._fitted and self._model_data_hash != self._data_hash:
+            return None
+
+        question_embeddings = self._load_question_embeddings()
+        if question_embeddings is None:
+            return None
+
+        vecs = question_embeddings.get_vectors(df.index, self._dtype)
+        if vecs is None:
+            return None
+
+        return question_embeddings.model, vecs
+
+    # --- fitted model -----------------------------------------------------------
+
+    def _fit_model(self, df):
+        model, _ = self._get_question_vecs(self._preprocess_df(df))
+        return model
+
+    def _transform(self, proc_texts):
+        _, vecs = self._get_unit_question_vecs(proc_texts, self._model)
+        return vecs
+
+    def _get_fitted_pair_sims(self, proc_texts, xs, ys):
+        """Cosine similarities of pairs of texts embedded using the fitted model. NaN for texts without usable words"""
+        vecs = self._transform(proc_texts)
+        return (vecs[xs] * vecs[ys]).sum(axis=1)
+
+    # --- similarities -----------------------------------------------------------
 
     def _get_similarity_matrix(self, df):
+        precomputed = self._get_precomputed_question_vecs(df)
+        if precomputed is not None:
+            _, vecs = precomputed
+            return SymmetricMatrix.from_gram(vecs, dtype=self._dtype).apply(_exp_scale_in_place)
+
         proc_texts = self._preprocess_df(df)
 
-        return qsim.exp_scale(self._get_similarity_matrix_from_texts(proc_texts))
+        return self._get_similarity_matrix_from_texts(proc_texts).apply(_exp_scale_in_place)
 
     def _preprocess_question(self, question_series, cols):
-        text = ' '.join(str(x) for x in question_series[cols] if pd.notnull(x))
+        text = self.COL_SEP.join(str(x) for x in question_series[cols] if pd.notnull(x))
         item = self._preprocess_text(text)
         return item
 
@@ -37,7 +168,10 @@ class EmbeddingsBasedSim(BaseSim):
 
         return self._preprocess_question(question_series, cols)
 
-    def _preprocess_text(self, text):
+    def _get_preprocessing_key(self):
+        return 'word-vectors', self._wv_dict_model_name.name, self._rem_stopwords
+
+    def _preprocess_text_uncached(self, text):
         sents = qsim.text2sents(text)
         words = [w for s in sents for w in qsim.sent2words(s)]
         words = [w.lower() for w in words]
@@ -57,7 +191,59 @@ class EmbeddingsBasedSim(BaseSim):
 
         sm = self._get_similarity_matrix_from_texts(np.array([x, y]))
 
-        return sm[0, 1]
+        # no usable words in x or y
+        if np.isnan(sm.condensed[0]):
+            return None
+
+        return sm.condensed[0]
 
     def _get_similarity_matrix_from_texts(self, proc_texts):
-        raise NotImplementedError
\ No newline at end of file
+        """Cosine similarities of question vectors (SymmetricMatrix). Questions without usable words get NaNs"""
+        _, vecs = self._get_unit_question_vecs(proc_texts, self._model)
+
+        return SymmetricMatrix.from_gram(vecs, dtype=self._dtype)
+
+    def _get_question_vecs(self, proc_texts, model=None):
+        """Returns (model, matrix of question vectors - one row per text). If model (e.g. fitted TF-IDF vectorizer) is
+        None, it is fitted on proc_texts"""
+        raise NotImplementedError
+
+    def _get_unit_question_vecs(self, proc_texts, model=None):
+        """Returns (model, matrix of unit question vectors in the sim's dtype)"""
+        model, vecs = self._get_question_vecs(proc_texts, model)
+
+        # normalize, so that cosine similarity becomes a dot product. Vectors of zero length (no usable words) get NaNs
+        norms = np.linalg.norm(vecs, axis=1)[:, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vecs = np.where(norms > 0, vecs / norms, np.nan)
+
+        return model, vecs.astype(self._dtype, copy=False)
+
+    def _get_weighted_wv_sums(self, weights):
+        """Returns N x M matrix of sums of word vectors weighted by sparse N x V matrix of weights of words (columns are
+        rows of the word vectors matrix). Only vectors of words with non-zero weights are read, the weights are never
+        made dense"""
+        weights = sp.csr_matrix(weights, dtype=self._dtype)
+        used = np.unique(weights.indices)
+
+        return weights[:, used].dot(np.asarray(self._wv_dict.vectors[used], dtype=self._dtype).reshape(len(used), -1))
+
+    def _create_df_index(self, df):
+        precomputed = self._get_precomputed_question_vecs(df)
+        if precomputed is not None:
+            return precomputed
+
+        return super()._create_df_index(df)
+
+    def _create_index(self, proc_texts):
+        return self._get_unit_question_vecs(proc_texts, self._model)
+
+    def _get_index_sims(self, index, rows):
+        _, vecs = index
+        return _exp_scale_in_place(vecs[rows].dot(vecs.T))
+
+    def _get_index_text_sims(self, index, proc_text):
+        # plain cosine similarities, as get_text_sim gives (only similarity matrices are exp-scaled)
+        model, vecs = index
+        _, text_vecs = self._get_unit_question_vecs([proc_text], model)
+        return vecs.dot(text_vecs[0])
\ No newline at end of file
@@ -1,73 +1,138 @@
 import nltk
 import numpy as np
-import qsim.qsim_common as qsim
+import scipy.sparse as sp
+import qsim.resources as resources
 from support.common import *
 from qsim.sims.base_sim import BaseSim
+from qsim.symmetric_matrix import SymmetricMatrix, get_condensed_index, get_condensed_len
+
+
+# contractions nltk.word_tokenize splits (e.g. cannot -> can not) - the only thing it does to alphanumeric text, apart
+# from splitting it on whitespaces
+_CONTRACTIONS = nltk.tokenize.TreebankWordTokenizer.CONTRACTIONS2 + nltk.tokenize.TreebankWordTokenizer.CONTRACTIONS3
+
+
+def tokenize_alphanum(text):
+    """Fast equivalent of nltk.word_tokenize for text consisting only of [a-zA-Z0-9] and whitespaces"""
+    text = ' ' + text + ' '
+    for regexp in _CONTRACTIONS:
+        text = regexp.sub(r' \1 \2 ', text)
+
+    return text.split()
 
 
 class ExactSim(BaseSim):
-    def __init__(self, cols=None, debug=False, lower=True, stem=True, rem_stopwords=True, only_alphanum=True):
-        super().__init__(cols, debug)
+    COL_SEP = ' ||||| '
+    SKIP_NULL_COLS = False
+
+    def __init__(self, cols=None, debug=False, lower=True, stem=True, rem_stopwords=True, only_alphanum=True,
+                 preprocessing_n_jobs=1, dtype=np.float64):
+        super().__init__(cols, debug, preprocessing_n_jobs, dtype)
 
         self._lower = lower
         self._stem = stem
         self._rem_stopwords = rem_stopwords
         self._only_alphanum = only_alphanum
 
-        self._stemmer = nltk.stem.PorterStemmer()
-        self._sws = qsim.get_stop_words()
+        self._stem_word = resources.get_memoised_stem()
+        self._sws = resources.get_stop_words()
+
+    def _get_preprocessing_key(self):
+        return 'words', self._lower, self._stem, self._rem_stopwords, self._only_alphanum
 
-    def _preprocess_text(self, text):
+    def _preprocess_text_uncached(self, text):
         if self._lower:
             text = text.lower()
 
         if self._only_alphanum:
             text = re.sub(r"[^a-zA-Z0-9]", " ", text)
-
-        words = nltk.word_tokenize(text)
+            words = tokenize_alphanum(text)
+        else:
+            words = nltk.word_tokenize(text)
 
         if self._rem_stopwords:
             words = [w for w in words if w not in self._sws]
 
         if self._stem:
-            words = [self._stemmer.stem(t) for t in words]
+            words = [self._stem_word(t) for t in words]
 
         return ' '.join(words)
 
     def _preprocess_question(self, question_series, cols):
-        return ' ||||| '.join(str(x) for x in question_series[cols])
+        return self.COL_SEP.join(str(x) for x in question_series[cols])
 
     def preprocess_question(self, question_series):
         cols = self._cols if self._cols is not None else list(question_series.index)
 
         return self._preprocess_question(question_series, cols)
 
-    def _preprocess_df(self, df):
-        texts = []
-        cols = self._cols if self._cols is not None else list(df.columns)
-        for _, row in df.iterrows():
-            text = self._preprocess_question(row, cols)
-            texts.append(text)
-
-        proc_texts = [self._preprocess_text(text) for text in texts]
-
-        return np.array(proc_texts)
-
     def _get_text_sim(self, x, y):
         x = self._preprocess_text(x)
         y = self._preprocess_text(y)
 
         return 1 if x == y else 0
 
+    def _get_pair_sims(self, proc_texts, xs, ys):
+        codes, _ = pd.factorize(np.asarray(proc_texts, dtype=object))
+        return (codes[xs] == codes[ys]).astype(self._dtype)
+
+    def _get_text_groups(self, proc_array):
+        """Groups positions of identical texts (via hashing, so it's linear in number of texts). Returns list of arrays
+        of positions"""
+        codes, _ = pd.factorize(proc_array)
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.cumsum(np.bincount(codes))[:-1]
+
+        return np.split(order, boundaries) if len(codes) > 0 else []
+
+    def get_duplicate_groups(self, df, min_size=2):
+        """Returns groups of questions with identical (preprocessed) texts, as lists of their df index values, largest
+        groups first"""
+        groups = [g for g in self._get_text_groups(self._preprocess_df(df)) if len(g) >= min_size]
+        groups.sort(key=len, reverse=True)
+
+        return [list(df.index[g]) for g in groups]
+
     def _get_similarity_matrix(self, df):
         proc_array = self._preprocess_df(df)
 
         n = len(proc_array)
-        M = np.repeat(proc_array, n).reshape(n, n)
-        sm = np.zeros((n, n))
-        sm[M == M.T] = 1
-        return sm
+        condensed = np.zeros(get_condensed_len(n), dtype=self._dtype)
+
+        # positions in groups are ascending, so pairs of the upper triangle of each group are also above the diagonal
+        for g in self._get_text_groups(proc_array):
+            if len(g) > 1:
+                xs, ys = np.triu_indices(len(g), k=1)
+                condensed[get_condensed_index(n, g[xs], g[ys])] = 1
+
+        return SymmetricMatrix(condensed, n, diagonal=1)
+
+    def _get_sparse_similarity_matrix(self, df, min_sim):
+        n = len(df)
+        if min_sim is not None and min_sim > 1:
+            return sp.csr_matrix((n, n), dtype=self._dtype)
+
+        groups = self._get_text_groups(self._preprocess_df(df))
+
+        rows = np.concatenate([np.repeat(g, len(g)) for g in groups]) if n > 0 else np.array([], dtype=int)
+        cols = np.concatenate([np.tile(g, len(g)) for g in groups]) if n > 0 else np.array([], dtype=int)
+
+        return sp.csr_matrix((np.ones(len(rows), dtype=self._dtype), (rows, cols)), shape=(n, n))
+
+    def _create_index(self, proc_texts):
+        # texts are replaced by integer codes of their equivalence classes, so comparisons are cheap
+        codes, uniques = pd.factorize(np.array(proc_texts, dtype=object))
+        text2code = dict((t, c) for c, t in enumerate(uniques))
+
+        return text2code, codes
+
+    def _get_index_sims(self, index, rows):
+        _, codes = index
+        return (codes[rows][:, np.newaxis] == codes[np.newaxis, :]).astype(self._dtype)
 
+    def _get_index_text_sims(self, index, proc_text):
+        text2code, codes = index
+        return (codes == text2code.get(proc_text, -1)).astype(self._dtype)
 
 if __name__ == '__main__':
     df = load_clean_df().iloc[:5]
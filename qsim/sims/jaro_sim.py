@@ -1,16 +1,50 @@
 from support.common import *
 from qsim.sims.exact_sim import ExactSim
+from qsim.sims.base_sim import BaseSim
 from pyjarowinkler import distance as pyjarodist
-import pathos.multiprocessing as mp
+from qsim.jaro_winkler import JaroWinkler
+import qsim.parallel as parallel
+from qsim.symmetric_matrix import SymmetricMatrix, get_condensed_index, get_condensed_len
 import time
 import numpy as np
 
 
+def _get_row_block_pairs(n, row_block):
+    """Returns pairs (i, j) with j > i, for rows i of the row block - in the order of the condensed upper triangle"""
+    rows = np.arange(*row_block)
+    counts = n - 1 - rows
+
+    xs = np.repeat(rows, counts)
+    offsets = np.cumsum(counts) - counts
+    ys = xs + 1 + np.arange(len(xs)) - np.repeat(offsets, counts)
+
+    return xs, ys
+
+
+def _compute_row_block(jw, n, row_block, condensed):
+    start, end = row_block
+    xs, ys = _get_row_block_pairs(n, row_block)
+
+    offset = get_condensed_index(n, start, start + 1)
+
+    # pairs are scored as (later, earlier) text (Jaro-Winkler is not exactly symmetric)
+    condensed[offset:offset + len(xs)] = jw.get_pair_sims(ys, xs)
+
+
+def _compute_row_block_in_worker(row_block):
+    _compute_row_block(parallel.get_inherited('jw'), parallel.get_inherited('n'), row_block,
+                       parallel.get_inherited('condensed'))
+
+
 class JaroSim(ExactSim):
-    def __init__(self, cols=None, debug=False, lower=True, stem=True, rem_stopwords=True, only_alphanum=True, parallel=False):
-        super().__init__(cols, debug, lower, stem, rem_stopwords, only_alphanum)
+    CHUNK_COUNT = 20000
 
-        self._parallel=parallel
+    def __init__(self, cols=None, debug=False, lower=True, stem=True, rem_stopwords=True, only_alphanum=True, parallel=False,
+                 n_jobs=None, preprocessing_n_jobs=1, dtype=np.float64):
+        super().__init__(cols, debug, lower, stem, rem_stopwords, only_alphanum, preprocessing_n_jobs, dtype)
+
+        self._parallel = parallel
+        self._n_jobs = n_jobs
 
     def _get_text_sim(self, x, y):
         x = self._preprocess_text(x)
@@ -21,56 +55,81 @@ class JaroSim(ExactSim):
     def _compute(self, x, y):
         return pyjarodist.get_jaro_distance(x, y, winkler=True, scaling=0.1)
 
+    def _get_pair_sims(self, proc_texts, xs, ys):
+        return JaroWinkler(proc_texts).get_pair_sims(xs, ys)
+
     def _get_similarity_matrix(self, df):
         proc_array = self._preprocess_df(df)
 
         n = len(proc_array)
-        relevant_pairs = [(x, y) for x in range(n) for y in range(x)]
+        jw = JaroWinkler(proc_array)
 
         t = time.time()
-        results = self._get_similarity_matrix_parallel(proc_array, relevant_pairs) if self._parallel \
-            else self._get_similarity_matrix_serial(proc_array, relevant_pairs)
+        condensed = self._get_condensed_parallel(jw, n) if self._parallel else self._get_condensed_serial(jw, n)
         self._lg.debug('Took {} sec'.format(time.time() - t))
 
-        # now reconstruct matrix
-        rows = []
-        offset = 0
-        for i in range(n):
-            row = results[offset:offset + i] + [1] + [0] * (n - i - 1)
-            rows.append(row)
-            offset += i
+        return SymmetricMatrix(condensed, n, diagonal=1)
 
-        sm = np.array(rows)
+    def _get_row_blocks(self, n):
+        """Splits rows into contiguous blocks with roughly CHUNK_COUNT relevant pairs (those above diagonal) each"""
+        boundaries = [0]
+        pairs = 0
         for i in range(n):
-            sm[i, i + 1:] = sm[i + 1:, i]
+            pairs += n - 1 - i
+            if pairs >= self.CHUNK_COUNT:
+                boundaries.append(i + 1)
+                pairs = 0
+
+        if boundaries[-1] != n:
+            boundaries.append(n)
+
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def _get_condensed_serial(self, jw, n):
+        condensed = np.empty(get_condensed_len(n), dtype=self._dtype)
+
+        for row_block in self._get_row_blocks(n):
+            self._lg.debug('{}/{}'.format(row_block[0], n))
+            _compute_row_block(jw, n, row_block, condensed)
+
+        return condensed
+
+    def _get_condensed_parallel(self, jw, n):
+        # the encoded texts and the result array are inherited by forked workers - nothing big is pickled
+        condensed = parallel.create_shared_array(get_condensed_len(n), self._dtype)
 
-        return sm
+        parallel.run_in_pool(
+            _compute_row_block_in_worker,
+            self._get_row_blocks(n),
+            n_jobs=self._n_jobs,
+            inherited={'jw': jw, 'n': n, 'condensed': condensed}
+        )
 
-    def _get_similarity_matrix_serial(self, proc_array, relevant_pairs):
-        CHUNK_COUNT = 5000
-        results = []
+        return np.array(condensed)
 
-        for i, p in enumerate(relevant_pairs):
-            if i % CHUNK_COUNT == 0:
-                self._lg.debug('{}/{}'.format(i, len(relevant_pairs)))
-            results.append(self._compute(proc_array[p[0]], proc_array[p[1]]))
+    def _get_sparse_similarity_matrix(self, df, min_sim):
+        # similar (not only identical) texts matter here, so the hashing of ExactSim can't be used
+        return BaseSim._get_sparse_similarity_matrix(self, df, min_sim)
 
-        return results
+    def _create_index(self, proc_texts):
+        return list(proc_texts), JaroWinkler(proc_texts)
 
-    def _get_similarity_matrix_parallel(self, proc_array, relevant_pairs):
-        CHUNK_COUNT = 5000
+    def _get_index_sims(self, index, rows):
+        proc_texts, jw = index
+        n = len(proc_texts)
+        rows = np.asarray(rows)
 
-        with mp.Pool(32) as pool:
-            results = []
+        xs, ys = np.repeat(rows, n), np.tile(np.arange(n), len(rows))
 
-            for i in range(0, len(relevant_pairs), CHUNK_COUNT):
-                self._lg.debug('{}/{}'.format(i, len(relevant_pairs)))
-                chunk = relevant_pairs[i:i + CHUNK_COUNT]
-                chunk_results = list(pool.map(lambda p: self._compute(proc_array[p[0]], proc_array[p[1]]), chunk))
+        # pairs are scored in the same order as in the matrix (Jaro-Winkler is not exactly symmetric)
+        sims = jw.get_pair_sims(np.maximum(xs, ys), np.minimum(xs, ys)).reshape(len(rows), n)
+        sims[np.arange(len(rows)), rows] = 1
 
-                results.extend(chunk_results)
+        return sims
 
-        return results
+    def _get_index_text_sims(self, index, proc_text):
+        _, jw = index
+        return jw.get_text_sims(proc_text)
 
 if __name__ == '__main__':
     df = load_clean_df().iloc[:100]
@@ -1,7 +1,10 @@
 import numpy as np
+import scipy.sparse as sp
 import qsim.qsim_common as qsim
+import qsim.resources as resources
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.decomposition import PCA
+from sklearn.feature_extraction.text import CountVectorizer
 from support.common import *
 from qsim.sims.embeddings_based_sim import EmbeddingsBasedSim
 from qsim.qsim_common import W2vModelName
@@ -19,33 +22,61 @@ class SentVecSim(EmbeddingsBasedSim):
                  wf_dict_name=qsim.DEF_WF_DICT_NAME,
                  use_precomputed_first_pc=True,
                  alpha=0.001,
-                 rem_stopwords=True):
-        super().__init__(cols, debug, wv_dict_model_name, rem_stopwords)
-
-        self._wf_dict = qsim.load_word_frequencies_dict(wf_dict_name)
-        if rem_stopwords:
-            sws = qsim.get_stop_words()
-            self._wf_dict = dict((w, f) for w, f in self._wf_dict.items() if w not in sws)
+                 rem_stopwords=True,
+                 data_hash=None,
+                 preprocessing_n_jobs=1,
+                 dtype=np.float64):
+        super().__init__(cols, debug, wv_dict_model_name, rem_stopwords, data_hash, preprocessing_n_jobs, dtype)
+
+        self._wf_dict_name = wf_dict_name
+        self._wf_dict = resources.get_word_frequencies(wf_dict_name, rem_stopwords)
         self._total_words = sum(self._wf_dict.values())
         self._alpha = alpha
-        self._first_pc = qsim.load_1st_pc(wv_dict_model_name, rem_stopwords) if use_precomputed_first_pc else None
+        self._use_precomputed_first_pc = use_precomputed_first_pc
+        self._first_pc = resources.get_1st_pc(wv_dict_model_name, rem_stopwords) if use_precomputed_first_pc else None
 
-    def _get_question_vec(self, question_proc_text):
-        if len(question_proc_text) == 0:
-            return None
+        self._count_vectorizer = None
+        self._sif_weights = None
+
+    def _get_model_options(self):
+        return super()._get_model_options() + (self._wf_dict_name, self._alpha)
+
+    def _get_question_embeddings_options(self):
+        # the fitted model replaces the precomputed first PC, so only vectors computed without it depend on the choice
+        return super()._get_question_embeddings_options() + (self._use_precomputed_first_pc,)
+
+    def _get_fixed_first_pc(self):
+        """First PC of the fitted model, or the precomputed one. None = it's computed from the compared texts"""
+        return self._model if self._model is not None else self._first_pc
+
+    def _get_pair_sims(self, proc_texts, xs, ys):
+        sv_matrix = self._get_sent_vectors(proc_texts)
+        first_pc = self._get_fixed_first_pc()
+        if first_pc is not None:
+            sv_matrix = sv_matrix - sv_matrix.dot(first_pc.T).dot(first_pc)
 
-        word_vectors = []
+        sims = qsim.get_rowwise_cos_sims(sv_matrix[xs], sv_matrix[ys])
 
-        for w in question_proc_text.split():
-            word_prob = self._wf_dict[w] / self._total_words
-            weight = self._alpha/(self._alpha + word_prob)
-            v = self._wv_dict[w] * weight
+        empty = ~self._get_non_empty(proc_texts)
+        sims[empty[xs] | empty[ys]] = np.nan
 
-            word_vectors.append(v)
+        return sims
 
-        sent_vec = np.sum(word_vectors, axis=0) / len(question_proc_text)
+    def _get_sif_weights(self):
+        """SIF weight a/(a + p(w)) of each word of the word vectors' vocabulary (vector of V)"""
+        if self._sif_weights is None:
+            freqs = np.array([self._wf_dict.get(w, 0) for w in self._wv_dict.words], dtype=float)
+            self._sif_weights = self._alpha / (self._alpha + freqs / self._total_words)
 
-        return sent_vec
+        return self._sif_weights
+
+    def _get_token_counts(self, proc_texts):
+        """Sparse N x V matrix of counts of words (of the word vectors' vocabulary) in the texts"""
+        if self._count_vectorizer is None:
+            self._count_vectorizer = CountVectorizer(vocabulary=self._wv_dict.vocabulary, lowercase=False,
+                                                     tokenizer=str.split, token_pattern=None)
+
+        return self._count_vectorizer.transform(proc_texts)
 
     def _get_text_sim(self, x, y):
         x = self._preprocess_text(x)
@@ -54,38 +85,47 @@ class SentVecSim(EmbeddingsBasedSim):
         if pd.isnull(x) or pd.isnull(y) or x == '' or y == '':
             return None
 
-        sv_matrix = np.array(self._get_sent_vectors([x, y]))
-        if self._first_pc is not None:
-            sv_matrix = sv_matrix - sv_matrix.dot(self._first_pc.T).dot(self._first_pc)
+        sv_matrix = self._get_sent_vectors([x, y])
+        first_pc = self._get_fixed_first_pc()
+        if first_pc is not None:
+            sv_matrix = sv_matrix - sv_matrix.dot(first_pc.T).dot(first_pc)
 
         csm = cosine_similarity(sv_matrix, sv_matrix)
 
         return csm[0, 1]
 
     def _get_sent_vectors(self, proc_texts):
-        return [self._get_question_vec(text) for text in proc_texts]
+        """Returns N x M matrix of SIF weighted sums of word vectors of the texts, divided by lengths of the texts.
+        Rows of empty texts are zeros"""
+        # N = # of items
+        # V = # of vocab words
+        # M = dimensionality of vector space
+        weighted_counts = self._get_token_counts(proc_texts).dot(sp.diags(self._get_sif_weights()))
+        sv_matrix = self._get_weighted_wv_sums(weighted_counts)
+
+        text_lens = np.array([len(text) for text in proc_texts], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sv_matrix = np.where(text_lens[:, np.newaxis] > 0, sv_matrix / text_lens[:, np.newaxis], 0)
+
+        return sv_matrix.reshape(len(proc_texts), self._wv_dict.dim)
 
-    def _get_similarity_matrix_from_texts(self, proc_texts):
+    def _get_non_empty(self, proc_texts):
+        return np.array([len(text) > 0 for text in proc_texts], dtype=bool)
+
+    def _get_question_vecs(self, proc_texts, model=None):
         # N = # of items
         # V = # of vocab words
         # M = dimensionality of vector space
         # SV = sentence vector
         # PC = principal component
 
-        sent_vectors = self._get_sent_vectors(proc_texts)
-        faulty_indices = [i for i, sv in enumerate(sent_vectors) if sv is None]
-
-        # matrix of SVs - NxM (if no faulty vectors present)
-        sv_matrix = np.array([sv for sv in sent_vectors if sv is not None])
+        # create a matrix of SVs - NxM, including the faulty vectors (zeros)
+        sv_matrix = self._get_sent_vectors(proc_texts)
 
         # get first PC of PCA - a vector of M items (matrix 1xM)
-        first_pc = self._get_first_pc(sv_matrix)
-
-        # create a matrix including the faulty vectors (substituting zeros)
-        for i in range(len(sent_vectors)):
-            if sent_vectors[i] is None:
-                sent_vectors[i] = np.repeat(0, sv_matrix.shape[0])
-        sv_matrix = np.array(sent_vectors)
+        first_pc = model
+        if first_pc is None:
+            first_pc = self._get_first_pc(sv_matrix[self._get_non_empty(proc_texts)])
 
         # from each SV, subtract its projection onto onto the first PC
         # - the first dot product basically converts each sentence vector to its "strength" in direction of the first
@@ -93,15 +133,7 @@ class SentVecSim(EmbeddingsBasedSim):
         # - the second dot product basically scales the first PC by each these "strengths" (result is matrix NxM)
         sv_matrix = sv_matrix - sv_matrix.dot(first_pc.T).dot(first_pc)
 
-        # finally, cosine similarity on these sentence vectors
-        csm = cosine_similarity(sv_matrix, sv_matrix)
-
-        # wipe out entries on faulty indices
-        for fi in faulty_indices:
-            csm[fi, :] = np.nan
-            csm[:, fi] = np.nan
-
-        return csm
+        return first_pc, sv_matrix
 
     def _get_first_pc(self, sv_matrix):
         if self._first_pc is not None:
@@ -115,8 +147,7 @@ class SentVecSim(EmbeddingsBasedSim):
 
     def get_first_pc(self, df):
         proc_texts = self._preprocess_df(df)
-        sent_vectors = self._get_sent_vectors(proc_texts)
-        sv_matrix = np.array([sv for sv in sent_vectors if sv is not None])
+        sv_matrix = self._get_sent_vectors(proc_texts)[self._get_non_empty(proc_texts)]
         first_pc = self._get_first_pc(sv_matrix)
 
         return first_pc
@@ -1,28 +1,159 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from support.common import *
 from qsim.sims.exact_sim import ExactSim
+from qsim.tfidf_index import TfidfIndex
+from qsim.symmetric_matrix import SymmetricMatrix
+import qsim.resources as resources
+import qsim.qsim_common as qsim
+import scipy.sparse as sp
 
 
 class TfidfCosSim(ExactSim):
-    def __init__(self, cols=None, debug=False, lower=True, stem=True, rem_stopwords=True, only_alphanum=True):
-        super().__init__(cols, debug, lower, stem, rem_stopwords, only_alphanum)
+    def __init__(self, cols=None, debug=False, lower=True, stem=True, rem_stopwords=True, only_alphanum=True,
+                 use_precomputed_index=False, data_hash=None, preprocessing_n_jobs=1, dtype=np.float64):
+        """
+        :param data_hash: hash of the data file (see get_file_hash) questions come from. If given, the precomputed
+        index has to be created from the same data - otherwise vectors of changed questions would be outdated
+        """
+        super().__init__(cols, debug, lower, stem, rem_stopwords, only_alphanum, preprocessing_n_jobs, dtype)
+
+        self._data_hash = data_hash
+
+        if use_precomputed_index:
+            tfidf_index = self._load_tfidf_index(data_hash)
+            self._set_model(tfidf_index, tfidf_index.data_hash)
+
+    def get_tfidf_index_name(self):
+        return '.'.join([
+            'all-cols' if self._cols is None else '+'.join(self._cols),
+            'lower' if self._lower else 'orig-case',
+            'stem' if self._stem else 'no-stem',
+            'exc-stop' if self._rem_stopwords else 'inc-stop',
+            'alphanum' if self._only_alphanum else 'all-chars'
+        ])
+
+    def create_tfidf_index(self, df, data_hash=None):
+        proc_array = self._preprocess_df(df)
+
+        return TfidfIndex.create(proc_array, df.index, lowercase=self._lower, data_hash=data_hash)
+
+    def update_tfidf_index(self, tfidf_index, added_df, removed_uuids, data_hash=None):
+        """Returns tfidf_index updated with added and removed questions (only the added ones are preprocessed)"""
+        proc_array = self._preprocess_df(added_df) if len(added_df) > 0 else []
+
+        return tfidf_index.update(removed_uuids, proc_array, added_df.index, data_hash=data_hash)
+
+    def _load_tfidf_index(self, data_hash=None):
+        tfidf_index = resources.get_tfidf_index(self.get_tfidf_index_name())
+
+        if tfidf_index.version != TfidfIndex.VERSION:
+            raise ValueError('TF-IDF index {} is outdated (version {}, expected {}). Re-generate it via '
+                             'generate_pickles'.format(self.get_tfidf_index_name(), tfidf_index.version,
+                                                       TfidfIndex.VERSION))
+
+        if data_hash is not None and tfidf_index.data_hash != data_hash:
+            raise ValueError('TF-IDF index {} was created from other data (hash {}, expected {}). Re-generate it via '
+                             'generate_pickles'.format(self.get_tfidf_index_name(), tfidf_index.data_hash,
+                                                       data_hash))
+
+        return tfidf_index
+
+    def _fit_model(self, df):
+        # the model is a TF-IDF index of the questions, so that their vectors needn't be transformed again
+        return self.create_tfidf_index(df)
+
+    def _transform(self, proc_texts):
+        return self._model.transform(proc_texts).astype(self._dtype)
 
     def _get_text_sim(self, x, y):
         x = self._preprocess_text(x)
         y = self._preprocess_text(y)
 
+        if self._model is not None:
+            tfidf = self._model.transform([x, y])
+            return tfidf[0].dot(tfidf[1].T).toarray()[0, 0]
+
         vect = TfidfVectorizer(lowercase=self._lower)
         tfidf = vect.fit_transform([x, y])
-        return (tfidf * tfidf.T).A[0, 1]
+        return (tfidf * tfidf.T).toarray()[0, 1]
+
+    def _get_pair_sims(self, proc_texts, xs, ys):
+        if self._model is not None:
+            tfidf = self._transform(proc_texts)
+            return np.asarray(tfidf[xs].multiply(tfidf[ys]).sum(axis=1), dtype=float).ravel()
+
+        try:
+            count_matrix = CountVectorizer(lowercase=self._lower).fit_transform(proc_texts)
+        except ValueError:  # no words at all
+            return np.full(len(xs), np.nan)
+
+        tfidf_x, tfidf_y = qsim.get_pairwise_tfidf(count_matrix, xs, ys)
+        sims = qsim.get_rowwise_cos_sims(tfidf_x, tfidf_y)
+
+        # fitting TF-IDF on a pair of texts without any words fails
+        no_words = (tfidf_x.getnnz(axis=1) == 0) & (tfidf_y.getnnz(axis=1) == 0)
+        sims[no_words] = np.nan
+
+        return sims
+
+    def _get_tfidf_matrix(self, df):
+        """TF-IDF vectors of the questions in df (in the sim's dtype). If the sim has a model (fitted or precomputed
+        index), they are transformed using it - or taken from it, if the index was created from the same data as df
+        (see data_hash) and all questions are indexed. Otherwise, TF-IDF model is fitted on df"""
+        if self._model is None:
+            tfidf_vectorizer = TfidfVectorizer(lowercase=self._lower, dtype=self._dtype)
+            return tfidf_vectorizer.fit_transform(self._preprocess_df(df))
+
+        # questions are indexed by uuid only, so indexed vectors of other data could belong to different texts
+        if self._model_data_hash is not None and self._model_data_hash == self._data_hash:
+            rows = self._model.get_rows(df.index)
+            if rows is not None:
+                return self._model.doc_matrix[rows].astype(self._dtype)
+
+        return self._transform(self._preprocess_df(df))
 
     def _get_similarity_matrix(self, df):
-        proc_array = self._preprocess_df(df)
+        # TF-IDF vectors are L2-normalised, so cosine similarities are just dot products
+        tfidf_matrix = self._get_tfidf_matrix(df)
+        return SymmetricMatrix.from_gram(tfidf_matrix, dtype=self._dtype)
+
+    def _get_sparse_similarity_matrix(self, df, min_sim):
+        # TF-IDF vectors are L2-normalised, so cosine similarity is just a (sparse) dot product. It's computed for
+        # blocks of rows, so that the intermediate product stays bounded even for common words
+        tfidf_matrix = self._get_tfidf_matrix(df).tocsr()
+        n = tfidf_matrix.shape[0]
+        block_size = self._get_block_size(n, self.DEF_MAX_MEMORY_MB)
+
+        blocks = []
+        for start in range(0, n, block_size):
+            block = tfidf_matrix[start:start + block_size].dot(tfidf_matrix.T).tocsr()
+            if min_sim is not None:
+                block.data[block.data < min_sim] = 0
+                block.eliminate_zeros()
+            blocks.append(block)
+
+        return sp.vstack(blocks, format='csr') if len(blocks) > 0 else sp.csr_matrix((0, 0))
+
+    def _create_df_index(self, df):
+        if self._model is not None:
+            return self._model, self._get_tfidf_matrix(df)
+
+        return super()._create_df_index(df)
+
+    def _create_index(self, proc_texts):
+        tfidf_vectorizer = TfidfVectorizer(lowercase=self._lower, dtype=self._dtype)
+        tfidf_matrix = tfidf_vectorizer.fit_transform(proc_texts)
+
+        return tfidf_vectorizer, tfidf_matrix
+
+    def _get_index_sims(self, index, rows):
+        _, tfidf_matrix = index
+        return cosine_similarity(tfidf_matrix[rows], tfidf_matrix)
 
-        tfidf_vectorizer = TfidfVectorizer(lowercase=self._lower)
-        tfidf_matrix = tfidf_vectorizer.fit_transform(proc_array)
-        csm = cosine_similarity(tfidf_matrix, tfidf_matrix)
-        return csm
+    def _get_index_text_sims(self, index, proc_text):
+        tfidf_vectorizer, tfidf_matrix = index
+        return cosine_similarity(tfidf_vectorizer.transform([proc_text]), tfidf_matrix)[0]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,77 @@
+"""
+Survey membership of questions (e.g. rows of a df), for cross-survey comparisons. Survey ids are factorised to integer
+codes once and rows of each survey are stored as a contiguous range of a permutation, so that masking similarities of
+questions from the same survey needs neither string comparisons nor N x N temporaries
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class SurveyIndex:
+    def __init__(self, survey_ids):
+        """
+        :param survey_ids: survey id of each of N questions
+        """
+        self.codes, self.survey_ids = pd.factorize(np.asarray(survey_ids, dtype=object))
+
+        # rows of survey c are order[offsets[c]:offsets[c+1]], ascending
+        self.order = np.argsort(self.codes, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(self.codes, minlength=len(self.survey_ids)))])
+
+    @classmethod
+    def from_df(cls, df):
+        return cls(df['survey_id'])
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def n_surveys(self):
+        return len(self.survey_ids)
+
+    def get_survey_rows(self, code):
+        """Rows (ascending) of questions of the survey with given code"""
+        return self.order[self.offsets[code]:self.offsets[code + 1]]
+
+    def iter_survey_rows(self):
+        for code in range(self.n_surveys):
+            yield self.get_survey_rows(code)
+
+    # --- masking -----------------------------------------------------------
+
+    def is_same_survey(self, rows, cols):
+        """Returns bool array - for each pair (rows[i], cols[i]) (or of broadcast rows x cols) whether the questions
+        are from the same survey"""
+        return self.codes[rows] == self.codes[cols]
+
+    def is_cross_survey(self, rows, cols):
+        return self.codes[rows] != self.codes[cols]
+
+    def get_same_survey_mask(self, row):
+        """Returns bool vector of N - whether questions are from the same survey as the question at `row`"""
+        return self.codes == self.codes[row]
+
+    def wipe_same_survey(self, sim_matrix, value=0):
+        """Sets similarities of questions from the same survey in N x N sim_matrix to value, in place - survey by
+        survey, so no N x N mask is created"""
+        for rows in self.iter_survey_rows():
+            if len(rows) == 0:
+                continue
+
+            if rows[-1] - rows[0] + 1 == len(rows):
+                # questions of a survey usually come in a row
+                sim_matrix[rows[0]:rows[-1] + 1, rows[0]:rows[-1] + 1] = value
+            else:
+                sim_matrix[np.ix_(rows, rows)] = value
+
+    def wipe_same_survey_block(self, block, rows, value=0):
+        """Sets similarities of questions from the same survey in a block of rows (len(rows) x N) to value, in place"""
+        block[self.is_same_survey(np.asarray(rows)[:, np.newaxis], np.arange(len(self))[np.newaxis, :])] = value
+
+    def get_cross_survey_pairs(self, xs, ys):
+        """Filters pairs of rows (xs[i], ys[i]) to those of questions from different surveys. Returns (xs, ys)"""
+        xs, ys = np.asarray(xs, dtype=int), np.asarray(ys, dtype=int)
+        keep = self.is_cross_survey(xs, ys)
+
+        return xs[keep], ys[keep]
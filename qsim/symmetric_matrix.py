@@ -0,0 +1,110 @@
+"""
+Symmetric N x N matrices (e.g. pairwise similarities) stored as their condensed upper triangle - in the same layout as
+scipy.spatial.distance.squareform uses - plus the diagonal. Only N*(N-1)/2 pairs are computed and stored; the square
+form is created on demand
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.spatial.distance import squareform
+
+
+# max number of cells of the temporary block of dot products computed at once in from_gram
+DEF_BLOCK_CELLS = 2**22
+
+
+def get_condensed_index(n, i, j):
+    """Position of the pair (i, j), i < j, in the condensed upper triangle of a N x N matrix"""
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+def get_condensed_len(n):
+    return n * (n - 1) // 2
+
+
+class SymmetricMatrix:
+    def __init__(self, condensed, n, diagonal=1.0):
+        """
+        :param condensed: vector of N*(N-1)/2 values above the diagonal, row by row (as in squareform)
+        :param diagonal: scalar or vector of N values on the diagonal
+        """
+        self.n = n
+        self.condensed = np.asarray(condensed)
+        self.diagonal = np.broadcast_to(np.asarray(diagonal, dtype=self.condensed.dtype), (n,)).copy()
+
+        if len(self.condensed) != get_condensed_len(n):
+            raise ValueError('Condensed matrix of {} values does not match N={}'.format(len(self.condensed), n))
+
+    @property
+    def shape(self):
+        return self.n, self.n
+
+    @classmethod
+    def from_square(cls, sm):
+        sm = np.asarray(sm)
+        n = sm.shape[0]
+
+        return cls(sm[np.triu_indices(n, k=1)], n, np.diagonal(sm))
+
+    @classmethod
+    def from_gram(cls, vecs, block_cells=DEF_BLOCK_CELLS, dtype=np.float64):
+        """Dot products of all pairs of rows of vecs (dense or scipy sparse N x M matrix). For each block of rows, only
+        the products with the block and the rows below it are computed, i.e. about a half of the full N x N product.
+        The products are computed in the dtype of vecs and stored as dtype"""
+        n = vecs.shape[0]
+        condensed = np.empty(get_condensed_len(n), dtype=dtype)
+        diagonal = np.empty(n, dtype=dtype)
+        block_size = max(1, block_cells // max(n, 1))
+
+        offset = 0
+        for start in range(0, n, block_size):
+            end = min(start + block_size, n)
+
+            block = vecs[start:end].dot(vecs[start:].T)
+            block = block.toarray() if sp.issparse(block) else np.asarray(block)
+
+            # block[r, c] is the product of rows start + r and start + c
+            rows = np.arange(end - start)
+            diagonal[start:end] = block[rows, rows]
+
+            upper = block[np.arange(n - start)[np.newaxis, :] > rows[:, np.newaxis]]
+            condensed[offset:offset + len(upper)] = upper
+            offset += len(upper)
+
+        return cls(condensed, n, diagonal)
+
+    def apply(self, func):
+        """Applies element-wise func to all values and returns self (the matrix is modified; func itself may work in
+        place too, e.g. lambda x: qsim.exp_scale(x, out=x))"""
+        self.condensed = func(self.condensed)
+        self.diagonal = func(self.diagonal)
+
+        return self
+
+    def get_rows(self, rows):
+        """Returns rows at given positions (len(rows) x N matrix), without creating the whole square form"""
+        rows = np.asarray(rows)
+        cols = np.arange(self.n)
+
+        lo = np.minimum(rows[:, np.newaxis], cols[np.newaxis, :])
+        hi = np.maximum(rows[:, np.newaxis], cols[np.newaxis, :])
+        on_diagonal = lo == hi
+
+        idx = get_condensed_index(self.n, lo, hi)
+        idx[on_diagonal] = 0
+
+        values = self.condensed[idx] if len(self.condensed) > 0 else np.zeros(idx.shape, dtype=self.condensed.dtype)
+        values[on_diagonal] = np.broadcast_to(self.diagonal[np.newaxis, :], values.shape)[on_diagonal]
+
+        return values
+
+    def to_square(self):
+        """Returns the whole (N x N numpy array) matrix"""
+        if self.n < 2:
+            sm = np.zeros((self.n, self.n), dtype=self.condensed.dtype)
+        else:
+            sm = squareform(self.condensed, checks=False, force='tomatrix')
+
+        np.fill_diagonal(sm, self.diagonal)
+
+        return sm
@@ -0,0 +1,112 @@
+"""
+A fitted TF-IDF model over the whole question bank. It is built once (see generate_pickles.py), pickled to CHECKPT_DIR
+and then used by TfidfCosSim to transform new texts and score them via sparse dot products, without re-fitting.
+
+Raw word counts of the indexed questions are kept as well, so that the index can be updated incrementally (when
+questions are added or removed) with the same result as re-fitting it, but without preprocessing all questions again
+"""
+
+import datetime
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+
+class TfidfIndex:
+    # increase whenever the pickled structure changes, so that outdated pickles are detected
+    VERSION = 2
+
+    def __init__(self, vocabulary, count_matrix, uuids, lowercase=True, data_hash=None):
+        """
+        :param vocabulary: dict word -> column in count_matrix
+        :param count_matrix: sparse CSR matrix N x V - counts of words in the indexed questions
+        :param uuids: list of N uuids of the indexed questions
+        """
+        self.version = self.VERSION
+        self.created = datetime.datetime.now()
+        self.data_hash = data_hash
+
+        self.vocabulary = vocabulary
+        self.count_matrix = count_matrix.tocsr()
+        self.uuids = np.array(uuids)
+        self.lowercase = lowercase
+
+        # vector of V inverse document frequencies and L2-normalised sparse CSR matrix N x V - TF-IDF vectors of the
+        # indexed questions (the same as TfidfVectorizer's, i.e. smoothed IDF)
+        self.idf = self._get_idf(self.count_matrix)
+        self.doc_matrix = normalize(self.count_matrix.astype(float).dot(sp.diags(self.idf)), norm='l2').tocsr()
+
+        self._uuid2row = None
+        self._count_vectorizer = None
+
+    @staticmethod
+    def _get_idf(count_matrix):
+        n = count_matrix.shape[0]
+        doc_freqs = np.bincount(count_matrix.indices, minlength=count_matrix.shape[1])
+
+        return np.log((1 + n) / (1 + doc_freqs)) + 1
+
+    @classmethod
+    def create(cls, proc_texts, uuids, lowercase=True, data_hash=None):
+        count_vectorizer = CountVectorizer(lowercase=lowercase)
+        count_matrix = count_vectorizer.fit_transform(proc_texts)
+
+        return cls(count_vectorizer.vocabulary_, count_matrix, uuids, lowercase, data_hash)
+
+    def update(self, removed_uuids, added_proc_texts, added_uuids, data_hash=None):
+        """Returns a new index without questions with removed_uuids and with added questions. Words not present in
+        any question anymore are dropped from the vocabulary, new words are added to it"""
+        keep = ~np.isin(self.uuids, list(removed_uuids))
+
+        # extend vocabulary by new words (appended after the existing ones)
+        vocabulary = dict(self.vocabulary)
+        analyzer = CountVectorizer(lowercase=self.lowercase).build_analyzer()
+        new_words = sorted(set(w for text in added_proc_texts for w in analyzer(text)) - set(vocabulary))
+        for w in new_words:
+            vocabulary[w] = len(vocabulary)
+
+        kept_counts = self.count_matrix[keep]
+        kept_counts = sp.csr_matrix((kept_counts.data, kept_counts.indices, kept_counts.indptr),
+                                    shape=(kept_counts.shape[0], len(vocabulary)))
+        added_counts = CountVectorizer(lowercase=self.lowercase, vocabulary=vocabulary).transform(added_proc_texts)
+        count_matrix = sp.vstack([kept_counts, added_counts], format='csr')
+
+        # drop words without any occurrence
+        used = np.bincount(count_matrix.indices, minlength=len(vocabulary)) > 0
+        if not used.all():
+            words = sorted(vocabulary, key=vocabulary.get)
+            vocabulary = dict((w, i) for i, w in enumerate(w for w, u in zip(words, used) if u))
+            count_matrix = count_matrix[:, np.flatnonzero(used)]
+
+        uuids = list(self.uuids[keep]) + list(added_uuids)
+
+        return TfidfIndex(vocabulary, count_matrix, uuids, self.lowercase, data_hash)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_uuid2row'] = None
+        state['_count_vectorizer'] = None
+        return state
+
+    def transform(self, proc_texts):
+        """Returns L2-normalised TF-IDF vectors (sparse CSR matrix) of given texts. Words outside of vocabulary are
+        ignored"""
+        if self._count_vectorizer is None:
+            self._count_vectorizer = CountVectorizer(lowercase=self.lowercase, vocabulary=self.vocabulary)
+
+        counts = self._count_vectorizer.transform(proc_texts).astype(float)
+        tfidf = counts.dot(sp.diags(self.idf))
+
+        return normalize(tfidf, norm='l2', copy=False).tocsr()
+
+    def get_rows(self, uuids):
+        """Returns positions in doc_matrix of given uuids, or None if any of them is not indexed"""
+        if self._uuid2row is None:
+            self._uuid2row = dict((u, i) for i, u in enumerate(self.uuids))
+
+        rows = [self._uuid2row.get(u) for u in uuids]
+        if any(r is None for r in rows):
+            return None
+
+        return np.array(rows, dtype=int)
@@ -0,0 +1,66 @@
+"""
+Word vectors stored as a single V x M float32 matrix (one row per word of the vocabulary), instead of a dict of separate
+arrays. The matrix is saved in .npy format and memory-mapped when loaded, so loading is instant and all processes
+(e.g. dashboard workers) share one copy of it in the page cache
+"""
+
+import numpy as np
+
+
+class WordVectors:
+    def __init__(self, words, vectors):
+        """
+        :param words: list of V words
+        :param vectors: V x M matrix - vectors of the words (may be memory-mapped)
+        """
+        self.words = list(words)
+        self.vectors = vectors
+
+        self._word2row = dict((w, i) for i, w in enumerate(self.words))
+
+    @classmethod
+    def from_dict(cls, wv_dict, dtype=np.float32):
+        words = list(wv_dict.keys())
+        dim = len(next(iter(wv_dict.values()))) if len(words) > 0 else 0
+        vectors = np.array([wv_dict[w] for w in words], dtype=dtype).reshape(len(words), dim)
+
+        return cls(words, vectors)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    @property
+    def vocabulary(self):
+        """dict word -> row in vectors (e.g. for CountVectorizer). Must not be modified"""
+        return self._word2row
+
+    # --- dict-like interface -----------------------------------------------------------
+
+    def __contains__(self, word):
+        return word in self._word2row
+
+    def __getitem__(self, word):
+        return self.vectors[self._word2row[word]]
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def keys(self):
+        return list(self.words)
+
+    def items(self):
+        return ((w, self.vectors[i]) for i, w in enumerate(self.words))
+
+    # --- vectorised access -----------------------------------------------------------
+
+    def get_rows(self, words):
+        """Positions of given words in the vectors matrix (all of them must be in the vocabulary)"""
+        return np.array([self._word2row[w] for w in words], dtype=int)
+
+    def get_vectors(self, words):
+        """Returns len(words) x M matrix of vectors of given words (all of them must be in the vocabulary)"""
+        return np.asarray(self.vectors[self.get_rows(words)]).reshape(len(words), self.dim)
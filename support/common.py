@@ -4,6 +4,8 @@ import collections
 import support.general_helper as gh
 import re
 import pickle
+import hashlib
+import numpy as np
 
 ROOT_DIR = os.path.realpath(os.path.dirname(__file__)) + '/..'
 BUNDLED_DATA_DIR = ROOT_DIR + '/dashboard/bundled_data'
@@ -37,6 +39,9 @@ CLEAN_FULL_FPATH = DATA_DIR + '/clean-full.csv'
 # path where light (only main columns) CSV should be output by json2df
 CLEAN_LIGHT_FPATH = DATA_DIR + '/clean-light.csv'
 
+# path where json2df records which JSONs (and which versions of them) the clean CSVs were created from
+JSON_MANIFEST_FPATH = DATA_DIR + '/json-manifest.json'
+
 # NOTE! update also the paths in deploy-common.sh
 
 
@@ -62,6 +67,10 @@ def save_pickled_obj(obj, name):
     _save(_get_bundled_pickle_fpath(name))
 
 
+def pickled_obj_exists(name):
+    return os.path.exists(_get_standard_pickle_fpath(name)) or os.path.exists(_get_bundled_pickle_fpath(name))
+
+
 def load_pickled_obj(name):
     fpath = _get_standard_pickle_fpath(name)
     if not os.path.exists(fpath):
@@ -71,9 +80,48 @@ def load_pickled_obj(name):
         return pickle.load(f)
 
 
+def _get_standard_npy_fpath(name):
+    return '{}/{}.npy'.format(CHECKPT_DIR, name)
+
+
+def _get_bundled_npy_fpath(name):
+    return '{}/{}.npy'.format(BUNDLED_DATA_DIR, name)
+
+
+def save_npy_array(array, name):
+    """Stores a numpy array in .npy format (so that it can be memory-mapped when loaded)"""
+    np.save(_get_standard_npy_fpath(name), array)
+    np.save(_get_bundled_npy_fpath(name), array)
+
+
+def npy_array_exists(name):
+    return os.path.exists(_get_standard_npy_fpath(name)) or os.path.exists(_get_bundled_npy_fpath(name))
+
+
+def load_npy_array(name, mmap_mode='r'):
+    """Loads array stored via save_npy_array. By default it's memory-mapped read only, so the data are loaded lazily
+    and shared (via page cache) by all processes using them"""
+    fpath = _get_standard_npy_fpath(name)
+    if not os.path.exists(fpath):
+        fpath = _get_bundled_npy_fpath(name)
+
+    return np.load(fpath, mmap_mode=mmap_mode)
+
+
 # --- others -----------------------------------------------------------
 
 
+def get_file_hash(fpath):
+    """MD5 hash of file's content - used to detect whether data derived from the file are outdated"""
+    md5 = hashlib.md5()
+
+    with open(fpath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
 def get_survey_name_map():
     sdf = pd.read_excel(DATA_DIR + '/survey-names.xlsx', index_col=0)
     d = sdf['Survey Name'].to_dict()
@@ -0,0 +1,101 @@
+import nose.tools as nstools
+import pandas as pd
+
+import tests.helpers.patch_helper as patch_helper
+from json_to_df import json2df
+
+
+def _create_json_df(uids):
+    """Dataframe as created by json2df from a single JSON - indexed by uid"""
+    return pd.DataFrame({'qtext': ['text of {}'.format(uid) for uid in uids]}, index=pd.Index(uids, name='uid'))
+
+
+def _create_clean_df(uuids, uids):
+    return pd.DataFrame({'uid': uids, 'qtext': ['text of {}'.format(uid) for uid in uids]},
+                        index=pd.Index(uuids, name='uuid'), columns=['uid', 'qtext'])
+
+
+class TestUpdateFullDf:
+    MANIFEST = {
+        'a.json': {'md5': 'a-hash', 'uuids': ['a1', 'a2'], 'processed': '2017-06-01T00:00:00'},
+        'b.json': {'md5': 'b-hash', 'uuids': ['b1'], 'processed': '2017-06-01T00:00:00'},
+    }
+    CLEAN_DF = _create_clean_df(['a1', 'a2', 'b1'], ['a1', 'a2', 'b1'])
+
+    def _update(self, json_hashes, json_uids, manifest=MANIFEST):
+        """Runs update_full_df on the given JSONs (name -> hash of its content, name -> uids of rows created from it),
+        with nothing read from or written to disk. Returns its result, the saved full df and the saved manifest (None
+        if nothing was saved)"""
+        patches, mocks = patch_helper.patch([
+            'json_to_df.json2df.load_manifest',
+            'json_to_df.json2df._save_manifest',
+            'json_to_df.json2df.load_clean_df',
+            'json_to_df.json2df._save_clean_dfs',
+            'json_to_df.json2df.get_json_fpaths',
+            'json_to_df.json2df.get_file_hash',
+            'json_to_df.json2df._json2df_or_none',
+        ])
+
+        try:
+            mocks['load_manifest'].return_value = None if manifest is None else dict(manifest)
+            mocks['load_clean_df'].return_value = self.CLEAN_DF
+            mocks['_save_clean_dfs'].side_effect = lambda cdf: cdf
+            mocks['get_json_fpaths'].return_value = ['/jsons/{}'.format(n) for n in sorted(json_hashes)]
+            mocks['get_file_hash'].side_effect = lambda fpath: json_hashes[fpath.split('/')[-1]]
+            mocks['_json2df_or_none'].side_effect = lambda fpath, _: _create_json_df(json_uids[fpath.split('/')[-1]])
+
+            result = json2df.update_full_df(print_debug=False)
+
+            saved_df = mocks['_save_clean_dfs'].call_args[0][0] if mocks['_save_clean_dfs'].called else None
+            saved_manifest = mocks['_save_manifest'].call_args[0][0] if mocks['_save_manifest'].called else None
+        finally:
+            patch_helper.unpatch(patches)
+
+        return result, saved_df, saved_manifest
+
+    def test_nothing_changed(self):
+        (cdf, added_df, removed_df), saved_df, _ = self._update({'a.json': 'a-hash', 'b.json': 'b-hash'}, {})
+
+        nstools.assert_list_equal(list(cdf.index), ['a1', 'a2', 'b1'])
+        nstools.assert_equals(len(added_df), 0)
+        nstools.assert_equals(len(removed_df), 0)
+        nstools.assert_is_none(saved_df)
+
+    def test_changed_json_replaces_its_rows(self):
+        (cdf, added_df, removed_df), saved_df, saved_manifest = self._update(
+            {'a.json': 'a-hash-2', 'b.json': 'b-hash'}, {'a.json': ['a1', 'a3']})
+
+        nstools.assert_list_equal(list(removed_df.index), ['a1', 'a2'])
+        nstools.assert_list_equal(list(added_df.index), ['a1', 'a3'])
+        nstools.assert_list_equal(list(cdf.index), ['b1', 'a1', 'a3'])
+        nstools.assert_list_equal(list(saved_df.index), ['b1', 'a1', 'a3'])
+        nstools.assert_equals(saved_manifest['a.json']['md5'], 'a-hash-2')
+        nstools.assert_list_equal(saved_manifest['a.json']['uuids'], ['a1', 'a3'])
+        nstools.assert_equals(saved_manifest['b.json'], self.MANIFEST['b.json'])
+
+    def test_deleted_json_removes_its_rows(self):
+        (cdf, added_df, removed_df), _, saved_manifest = self._update({'a.json': 'a-hash'}, {})
+
+        nstools.assert_list_equal(list(removed_df.index), ['b1'])
+        nstools.assert_equals(len(added_df), 0)
+        nstools.assert_list_equal(list(cdf.index), ['a1', 'a2'])
+        nstools.assert_not_in('b.json', saved_manifest)
+
+    def test_new_uuids_dont_collide(self):
+        (cdf, added_df, _), _, saved_manifest = self._update(
+            {'a.json': 'a-hash', 'b.json': 'b-hash', 'c.json': 'c-hash'}, {'c.json': ['b1', 'c1', 'c1']})
+
+        nstools.assert_list_equal(list(added_df.index), ['b1_(0)', 'c1_(0)', 'c1_(1)'])
+        nstools.assert_list_equal(list(added_df['uid']), ['b1', 'c1', 'c1'])
+        nstools.assert_true(cdf.index.is_unique)
+        nstools.assert_list_equal(saved_manifest['c.json']['uuids'], ['b1_(0)', 'c1_(0)', 'c1_(1)'])
+
+    def test_missing_manifest_fails_without_saving(self):
+        nstools.assert_raises(ValueError, self._update, {'a.json': 'a-hash', 'b.json': 'b-hash'}, {}, None)
+
+
+class TestGetNewUuids:
+    def test_uids_made_unique(self):
+        actual = json2df._get_new_uuids(['x', 'y', 'y', 'z'], ['x', 'y_(0)'])
+
+        nstools.assert_list_equal(actual, ['x_(0)', 'y_(1)', 'y_(2)', 'z'])
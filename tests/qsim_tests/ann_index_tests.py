@@ -0,0 +1,31 @@
+import nose.tools as nstools
+import numpy as np
+
+from qsim.ann_index import IvfIndex
+
+
+class TestIvfIndex:
+    rnd = np.random.RandomState(0)
+    vecs = rnd.randn(200, 8)
+    vecs /= np.linalg.norm(vecs, axis=1)[:, np.newaxis]
+    ids = np.array(['q{}'.format(i) for i in range(200)])
+
+    def test_exact_when_all_lists_probed(self):
+        index = IvfIndex.create(self.vecs, self.ids, n_lists=10)
+        query = self.vecs[3]
+
+        ids, sims = index.search(query, k=5, nprobe=10)
+
+        expected = np.argsort(-self.vecs.dot(query))[:5]
+        nstools.assert_equals(list(ids), list(self.ids[expected]))
+        np.testing.assert_allclose(sims, self.vecs[expected].dot(query), rtol=1e-5)
+
+    def test_vectors_with_nans_are_not_indexed(self):
+        vecs = self.vecs.copy()
+        vecs[0] = np.nan
+
+        index = IvfIndex.create(vecs, self.ids, n_lists=4)
+
+        nstools.assert_equals(len(index.ids), 199)
+        nstools.assert_false('q0' in index.ids)
+        nstools.assert_equals(len(index.search(vecs[0])[0]), 0)
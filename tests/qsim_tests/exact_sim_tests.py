@@ -0,0 +1,66 @@
+import re
+import nltk
+import nose.tools as nstools
+import numpy as np
+import pandas as pd
+
+import qsim.resources as resources
+from qsim.sims.exact_sim import ExactSim, tokenize_alphanum
+
+
+TEXTS = [
+    'What was the value of your turnover, excluding VAT?',
+    'Cannot gimme   lemme wanna gonna gotta CANNOT',
+    'wanna',
+    'wanna1 cannot2 canned notes',
+    'Number of employees (full-time & part-time) at 31/12/2017',
+    '',
+    '   ',
+]
+
+
+class TestExactSim:
+    def test_tokenize_alphanum_equals_word_tokenize(self):
+        for text in TEXTS:
+            text = re.sub(r"[^a-zA-Z0-9]", " ", text)
+            nstools.assert_equals(tokenize_alphanum(text), nltk.word_tokenize(text))
+
+    def test_preprocessing_equals_unoptimised_one(self):
+        stemmer = resources.get_stemmer()
+        sws = resources.get_stop_words()
+
+        for lower in [True, False]:
+            sim = ExactSim(lower=lower)
+
+            for text in TEXTS:
+                expected = re.sub(r"[^a-zA-Z0-9]", " ", text.lower() if lower else text)
+                expected = ' '.join(stemmer.stem(w) for w in nltk.word_tokenize(expected) if w not in sws)
+
+                nstools.assert_equals(sim._preprocess_text_uncached(text), expected)
+
+    def test_joined_cols_equal_joined_rows(self):
+        df = pd.DataFrame({'a': ['x', None, '', 'y'], 'b': ['z', 'w', np.nan, np.nan], 'c': [1, 2, 3, 4]})
+        sim = ExactSim(cols=['a', 'b', 'c'])
+
+        expected = [sim.preprocess_question(row) for _, row in df.iterrows()]
+        nstools.assert_equals(sim._join_cols(df), expected)
+
+    def test_parallel_preprocessing_equals_serial_one(self):
+        texts = ['{} cannot be {} items'.format(TEXTS[i % len(TEXTS)], i) for i in range(2500)]
+
+        serial = ExactSim()._preprocess_many(texts)
+        parallel = ExactSim(preprocessing_n_jobs=2)._preprocess_many(texts)
+
+        nstools.assert_equals(parallel, serial)
+
+    def test_cs_only_and_min_sim_wipe_dense_matrix(self):
+        df = pd.DataFrame({'text': ['a b', 'a b', 'a b', 'c d'], 'survey_id': ['1', '2', '1', '2']})
+        sims = ExactSim(cols=['text']).get_similarity_matrix(df, cs_only=True, min_sim=0.5)
+
+        expected = np.array([
+            [0, 1, 0, 0],
+            [1, 0, 1, 0],
+            [0, 1, 0, 0],
+            [0, 0, 0, 0],
+        ])
+        np.testing.assert_array_equal(sims, expected)
@@ -0,0 +1,69 @@
+import random
+
+import nose.tools as nstools
+import numpy as np
+from pyjarowinkler import distance as pyjarodist
+
+from qsim.jaro_winkler import JaroWinkler, get_jaro_winkler_sims
+
+
+def _get_expected(x, y):
+    try:
+        return pyjarodist.get_jaro_distance(x, y, winkler=True, scaling=0.1)
+    except Exception:
+        return np.nan
+
+
+class TestJaroWinkler:
+    TEXTS = [
+        'martha',
+        'marhta',
+        'MARTHA',
+        'dwayne',
+        'duane',
+        'dixon',
+        'dicksonx',
+        'value of turnov exclud vat',
+        'valu turnov includ vat',
+        'a',
+        'aa',
+        'a*b',
+        ''
+    ]
+
+    def _assert_same_as_pyjarowinkler(self, texts):
+        n = len(texts)
+        xs, ys = np.repeat(np.arange(n), n), np.tile(np.arange(n), n)
+
+        actual = JaroWinkler(texts).get_pair_sims(xs, ys, chunk_size=100)
+        expected = np.array([_get_expected(texts[x], texts[y]) for x, y in zip(xs, ys)])
+
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_same_as_pyjarowinkler(self):
+        self._assert_same_as_pyjarowinkler(self.TEXTS)
+
+    def test_same_as_pyjarowinkler_on_random_texts(self):
+        rnd = random.Random(0)
+        texts = [''.join(rnd.choice('abcAB ') for _ in range(rnd.randint(1, 15))) for _ in range(80)]
+
+        self._assert_same_as_pyjarowinkler(texts)
+
+    def test_scores_text_against_many(self):
+        actual = get_jaro_winkler_sims('martha', ['marhta', 'dwayne'])
+
+        nstools.assert_equals(list(actual), [_get_expected('martha', 'marhta'), _get_expected('martha', 'dwayne')])
+
+    def test_scores_other_texts_without_reencoding(self):
+        rnd = random.Random(1)
+        texts = [''.join(rnd.choice('abcAB ') for _ in range(rnd.randint(0, 12))) for _ in range(30)]
+        queries = ['martha', 'abc', 'xyz', 'a*b', '', 'BAab c']
+
+        jw = JaroWinkler(texts)
+        other = jw.encode_other(queries)
+        xs, ys = np.repeat(np.arange(len(queries)), len(texts)), np.tile(np.arange(len(texts)), len(queries))
+
+        actual = jw.get_other_pair_sims(other, xs, ys)
+        expected = np.array([_get_expected(queries[x], texts[y]) for x, y in zip(xs, ys)])
+
+        np.testing.assert_array_equal(actual, expected)
@@ -0,0 +1,44 @@
+import pickle
+import nose.tools as nstools
+
+from qsim.preprocessing_cache import PreprocessingCache
+
+
+class TestPreprocessingCache:
+    def test_each_text_is_preprocessed_once_per_options(self):
+        cache = PreprocessingCache()
+        calls = []
+
+        def preprocess(text):
+            calls.append(text)
+            return text.upper()
+
+        nstools.assert_equals(cache.get('a', 'x y', preprocess), 'X Y')
+        nstools.assert_equals(cache.get('a', 'x y', preprocess), 'X Y')
+        nstools.assert_equals(cache.get('b', 'x y', preprocess), 'X Y')
+
+        nstools.assert_equals(calls, ['x y', 'x y'])
+        nstools.assert_equals((cache.hits, cache.misses), (1, 2))
+
+    def test_least_recently_used_entries_are_dropped(self):
+        cache = PreprocessingCache(max_entries=2)
+
+        cache.get('a', 'x', str.upper)
+        cache.get('a', 'y', str.upper)
+        cache.get('a', 'x', str.upper)
+        cache.get('a', 'z', str.upper)
+
+        nstools.assert_equals(len(cache), 2)
+        nstools.assert_equals(cache.get('a', 'x', lambda t: None), 'X')
+        nstools.assert_equals(cache.get('a', 'y', lambda t: None), None)
+
+    def test_clear_and_pickling(self):
+        cache = PreprocessingCache()
+        cache.get('a', 'x', str.upper)
+        cache.get('b', 'x', str.upper)
+
+        cache.clear('a')
+        cache = pickle.loads(pickle.dumps(cache))
+
+        nstools.assert_equals(len(cache), 1)
+        nstools.assert_equals(cache.get('b', 'x', lambda t: None), 'X')
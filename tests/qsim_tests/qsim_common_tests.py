@@ -0,0 +1,23 @@
+import nose.tools as nstools
+import numpy as np
+
+import qsim.qsim_common as qsim
+
+
+class TestExpScale:
+    def test_scales_ends_to_themselves(self):
+        np.testing.assert_allclose(qsim.exp_scale(np.array([0.0, 0.5, 1.0])), [0, (10 ** 0.5 - 1) / 9, 1])
+
+    def test_integer_input_scaled_as_floats(self):
+        actual = qsim.exp_scale(np.array([0, 1]))
+
+        nstools.assert_equals(actual.dtype, np.float64)
+        np.testing.assert_array_equal(actual, [0.0, 1.0])
+
+    def test_float32_input_kept_in_float32(self):
+        X = np.array([0.0, 0.5, 1.0], dtype=np.float32)
+
+        actual = qsim.exp_scale(X, out=X)
+
+        nstools.assert_true(actual is X)
+        nstools.assert_equals(actual.dtype, np.float32)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+import qsim.resources as resources
+import tests.helpers.patch_helper as patch_helper
+from qsim.word_vectors import WordVectors
+from qsim.sims.avg_word_vec_sim import AvgWordVecSim
+from qsim.sims.exact_sim import ExactSim
+from qsim.sims.jaro_sim import JaroSim
+from qsim.sims.tfidf_cos_sim import TfidfCosSim
+
+
+TEXTS = [
+    'What was the value of your turnover, excluding VAT?',
+    'Value of turnover including VAT',
+    'value of turnover excluding vat',
+    'Number of employees at the end of the period',
+    'How many employees did the business have?',
+    'employees employees turnover',
+    'the of and',  # only stop words
+    '!!! ???',  # no alphanumeric characters
+    'xyzzy plugh',  # no words with word vectors
+    '',
+]
+PAIRS = [(x, y) for x in TEXTS for y in TEXTS]
+
+
+class TestScorePairs:
+    WV_DICT = dict((w, np.random.RandomState(i).rand(5)) for i, w in enumerate(
+        ['value', 'turnover', 'excluding', 'including', 'vat', 'number', 'employees', 'end', 'period', 'many',
+         'business']))
+
+    def _assert_same_as_text_sims(self, sim):
+        actual = sim.score_pairs(PAIRS)
+
+        text_sims = [sim.get_text_sim(x, y) for x, y in PAIRS]
+        expected = np.array([np.nan if s is None else s for s in text_sims], dtype=float)
+
+        np.testing.assert_allclose(actual, expected, atol=1e-12)
+
+    def test_exact_sim(self):
+        self._assert_same_as_text_sims(ExactSim())
+
+    def test_tfidf_cos_sim(self):
+        self._assert_same_as_text_sims(TfidfCosSim())
+
+    def test_tfidf_cos_sim_without_stemming_and_stop_words_removal(self):
+        self._assert_same_as_text_sims(TfidfCosSim(stem=False, rem_stopwords=False))
+
+    def test_jaro_sim(self):
+        self._assert_same_as_text_sims(JaroSim())
+
+    def test_avg_word_vec_sim(self):
+        patches, mocks = patch_helper.patch(['qsim.resources.get_word_vectors'])
+        mocks['get_word_vectors'].return_value = WordVectors.from_dict(self.WV_DICT)
+
+        sim = AvgWordVecSim()
+        try:
+            self._assert_same_as_text_sims(sim)
+        finally:
+            patch_helper.unpatch(patches)
+
+            # texts were preprocessed with the fake vocabulary
+            resources.get_preprocessing_cache().clear(sim._get_preprocessing_key())
+
+    def test_avg_word_vec_text_scores_same_as_text_sims(self):
+        patches, mocks = patch_helper.patch(['qsim.resources.get_word_vectors'])
+        mocks['get_word_vectors'].return_value = WordVectors.from_dict(self.WV_DICT)
+
+        sim = AvgWordVecSim(cols=['text'])
+        df = pd.DataFrame({'text': TEXTS[:-1]})
+        text = 'turnover of the business'
+        try:
+            # fitted, so that IDFs are the same for the whole df and for each pair
+            sim.fit(df)
+
+            actual = sim.score_text_against(df, text)
+            expected = np.array([np.nan if s is None else s for s in [sim.get_text_sim(x, text) for x in df['text']]],
+                                dtype=float)
+
+            np.testing.assert_allclose(actual, expected, atol=1e-12)
+        finally:
+            patch_helper.unpatch(patches)
+
+            resources.get_preprocessing_cache().clear(sim._get_preprocessing_key())
@@ -0,0 +1,33 @@
+import nose.tools as nstools
+import numpy as np
+
+import tests.helpers.patch_helper as patch_helper
+from qsim.word_vectors import WordVectors
+from qsim.sims.sent_vec_sim import SentVecSim
+
+
+class TestQuestionEmbeddingsName:
+    def _get_names(self, *sim_params):
+        patches, mocks = patch_helper.patch(['qsim.resources.get_word_vectors', 'qsim.resources.get_word_frequencies',
+                                             'qsim.resources.get_1st_pc'])
+        try:
+            mocks['get_word_vectors'].return_value = WordVectors.from_dict({'turnover': np.ones(3)})
+            mocks['get_word_frequencies'].return_value = {'turnover': 1}
+            mocks['get_1st_pc'].return_value = np.ones((1, 3))
+
+            return [SentVecSim(**params).get_question_embeddings_name('data-hash') for params in sim_params]
+        finally:
+            patch_helper.unpatch(patches)
+
+    def test_name_depends_on_all_options_of_question_vectors(self):
+        names = self._get_names({}, {'alpha': 0.01}, {'wf_dict_name': 'other-wf-dict'},
+                                {'use_precomputed_first_pc': False}, {'rem_stopwords': False}, {'cols': ['qtext']})
+
+        nstools.assert_equals(len(set(names)), len(names))
+
+    def test_same_options_give_same_name(self):
+        names = self._get_names({'alpha': 0.01}, {'alpha': 0.01})
+
+        nstools.assert_equals(names[0], names[1])
+        nstools.assert_true(names[0].startswith('SentVecSim.'))
+        nstools.assert_true(names[0].endswith('.data-hash'))
@@ -0,0 +1,46 @@
+import nose.tools as nstools
+import numpy as np
+
+from qsim.survey_index import SurveyIndex
+
+
+class TestSurveyIndex:
+    # survey 'b' is split in two runs of rows
+    survey_ids = np.array(['a', 'a', 'b', 'b', 'c', 'b', 'a'], dtype=object)
+    same_survey = survey_ids[:, np.newaxis] == survey_ids[np.newaxis, :]
+
+    def test_survey_rows(self):
+        si = SurveyIndex(self.survey_ids)
+
+        nstools.assert_equals(si.n_surveys, 3)
+        nstools.assert_equals([list(rows) for rows in si.iter_survey_rows()], [[0, 1, 6], [2, 3, 5], [4]])
+
+    def test_wipe_same_survey_same_as_mask(self):
+        sim_matrix = np.random.RandomState(0).rand(7, 7)
+        expected = np.where(self.same_survey, 0, sim_matrix)
+
+        SurveyIndex(self.survey_ids).wipe_same_survey(sim_matrix)
+
+        np.testing.assert_array_equal(sim_matrix, expected)
+
+    def test_wipe_same_survey_block_same_as_mask(self):
+        rows = [2, 3, 4]
+        block = np.random.RandomState(0).rand(3, 7)
+        expected = np.where(self.same_survey[rows], 0, block)
+
+        SurveyIndex(self.survey_ids).wipe_same_survey_block(block, rows)
+
+        np.testing.assert_array_equal(block, expected)
+
+    def test_cross_survey_pairs(self):
+        xs, ys = SurveyIndex(self.survey_ids).get_cross_survey_pairs([0, 0, 2, 4, 5], [1, 2, 5, 3, 6])
+
+        nstools.assert_equals(list(zip(xs, ys)), [(0, 2), (4, 3), (5, 6)])
+
+    def test_empty(self):
+        si = SurveyIndex([])
+        sim_matrix = np.empty((0, 0))
+
+        si.wipe_same_survey(sim_matrix)
+
+        nstools.assert_equals(len(si), 0)
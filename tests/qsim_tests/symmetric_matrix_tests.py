@@ -0,0 +1,61 @@
+import nose.tools as nstools
+import numpy as np
+import scipy.sparse as sp
+
+import qsim.qsim_common as qsim
+from qsim.symmetric_matrix import SymmetricMatrix
+
+
+class TestSymmetricMatrix:
+    vecs = np.random.RandomState(0).rand(7, 3)
+    gram = vecs.dot(vecs.T)
+
+    def test_from_gram_same_as_full_product(self):
+        sm = SymmetricMatrix.from_gram(self.vecs, block_cells=10)
+
+        np.testing.assert_allclose(sm.to_square(), self.gram)
+
+    def test_from_gram_of_sparse_matrix(self):
+        sm = SymmetricMatrix.from_gram(sp.csr_matrix(self.vecs))
+
+        np.testing.assert_allclose(sm.to_square(), self.gram)
+
+    def test_from_gram_in_float32(self):
+        sm = SymmetricMatrix.from_gram(self.vecs.astype(np.float32), block_cells=10, dtype=np.float32)
+
+        nstools.assert_equals(sm.to_square().dtype, np.float32)
+        np.testing.assert_allclose(sm.to_square(), self.gram, atol=1e-6)
+
+    def test_apply_exp_scale_in_place(self):
+        expected = qsim.exp_scale(self.gram[np.triu_indices(7, k=1)])
+
+        sm = SymmetricMatrix.from_gram(self.vecs)
+        condensed = sm.condensed
+        sm.apply(lambda x: qsim.exp_scale(x, out=x))
+
+        nstools.assert_true(sm.condensed is condensed)
+        np.testing.assert_array_equal(sm.condensed, expected)
+
+    def test_roundtrip_from_square(self):
+        sm = SymmetricMatrix.from_square(self.gram)
+
+        nstools.assert_equals(len(sm.condensed), 7 * 6 // 2)
+        np.testing.assert_array_equal(sm.to_square(), self.gram)
+
+    def test_get_rows(self):
+        sm = SymmetricMatrix.from_square(self.gram)
+
+        np.testing.assert_array_equal(sm.get_rows([4, 0]), self.gram[[4, 0]])
+
+    def test_apply(self):
+        sm = SymmetricMatrix.from_square(self.gram).apply(np.sqrt)
+
+        np.testing.assert_allclose(sm.to_square(), np.sqrt(self.gram))
+
+    def test_tiny_matrices(self):
+        np.testing.assert_array_equal(SymmetricMatrix([], 1, diagonal=1).to_square(), [[1]])
+        nstools.assert_equals(SymmetricMatrix([], 0).to_square().shape, (0, 0))
+
+    @nstools.raises(ValueError)
+    def test_wrong_size(self):
+        SymmetricMatrix([1, 2], 3)
@@ -0,0 +1,79 @@
+import nose.tools as nstools
+import numpy as np
+import pandas as pd
+
+from qsim.sims.base_sim import OUTPUT_EDGES
+from qsim.sims.tfidf_cos_sim import TfidfCosSim
+
+
+class TestTfidfCosSim:
+    df = pd.DataFrame({
+        'text': [
+            'What was the value of your turnover, excluding VAT?',
+            'Value of turnover including VAT',
+            'Number of employees at the end of the period',
+            'How many employees did the business have?',
+            'Total value of exports',
+            '',
+        ],
+        'survey_id': ['1', '1', '2', '2', '3', '3'],
+    })
+
+    def test_float32_similarities_close_to_float64_ones(self):
+        sims64 = TfidfCosSim(cols=['text']).get_similarity_matrix(self.df)
+        sims32 = TfidfCosSim(cols=['text'], dtype=np.float32).get_similarity_matrix(self.df)
+
+        nstools.assert_equals(sims32.dtype, np.float32)
+        np.testing.assert_allclose(sims32, sims64, atol=1e-6)
+
+    def test_float32_scores_close_to_float64_ones(self):
+        text = 'turnover value'
+        sims64 = TfidfCosSim(cols=['text']).score_text_against(self.df, text)
+        sims32 = TfidfCosSim(cols=['text'], dtype=np.float32).score_text_against(self.df, text)
+
+        nstools.assert_equals(sims32.dtype, np.float32)
+        np.testing.assert_allclose(sims32, sims64, atol=1e-6)
+
+    def test_transform_of_unfitted_sim_fails(self):
+        nstools.assert_raises(ValueError, TfidfCosSim(cols=['text']).transform, ['turnover'])
+
+    def test_fitted_sim_scores_texts_by_the_fitted_model(self):
+        sim = TfidfCosSim(cols=['text']).fit(self.df)
+        x, y = 'turnover value', 'value of exports'
+
+        vecs = sim.transform([x, y])
+
+        nstools.assert_almost_equals(sim.get_text_sim(x, y), vecs[0].dot(vecs[1].T).toarray()[0, 0])
+        np.testing.assert_allclose(sim.score_pairs([(x, y)]), [sim.get_text_sim(x, y)])
+
+    def test_fitted_model_not_refitted_on_compared_questions(self):
+        fitted = TfidfCosSim(cols=['text']).fit(self.df)
+        refitted = TfidfCosSim(cols=['text'])
+
+        sims = fitted.get_similarity_matrix(self.df.iloc[:2])
+
+        np.testing.assert_allclose(sims, fitted.get_similarity_matrix(self.df)[:2, :2])
+        nstools.assert_false(np.allclose(sims, refitted.get_similarity_matrix(self.df.iloc[:2])))
+
+    def test_fitted_sim_scores_questions_of_other_data_by_their_texts(self):
+        # questions of both dfs have the same uuids (0, 1, 2), but different texts
+        sim = TfidfCosSim(cols=['text']).fit(pd.DataFrame({'text': ['turnover value', 'turnover value',
+                                                                    'employees number']}))
+        df = pd.DataFrame({'text': ['exports total', 'employees number', 'exports total']})
+
+        vecs = sim.transform(df['text'])
+        top = sim.get_top_k(df, 'number of employees', k=1)
+
+        np.testing.assert_allclose(sim.get_similarity_matrix(df), vecs.dot(vecs.T).toarray())
+        nstools.assert_equals(list(top.index), [1])
+        nstools.assert_almost_equals(top['similarity'].iloc[0], 1)
+
+    def test_edges_list_each_pair_of_different_questions_once(self):
+        sim = TfidfCosSim(cols=['text'])
+        dense = sim.get_similarity_matrix(self.df)
+
+        edges = sim.get_similarity_matrix(self.df, output=OUTPUT_EDGES)
+
+        rows, cols = np.nonzero(np.triu(dense, k=1))
+        nstools.assert_list_equal(list(zip(edges['uuid_x'], edges['uuid_y'])), list(zip(rows, cols)))
+        np.testing.assert_allclose(edges['similarity'], dense[rows, cols])
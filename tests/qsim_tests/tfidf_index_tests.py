@@ -0,0 +1,51 @@
+import nose.tools as nstools
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from qsim.tfidf_index import TfidfIndex
+
+
+TEXTS = [
+    'value turnover exclud vat',
+    'valu turnover includ vat',
+    'number employe end period',
+    'mani employe busi',
+    'total valu export',
+    '',
+]
+UUIDS = ['a', 'b', 'c', 'd', 'e', 'f']
+
+
+def _by_words(tfidf_index, matrix):
+    """Dense matrix of the index's TF-IDF vectors with columns ordered by words (vocabulary of an updated index isn't
+    sorted)"""
+    return matrix.toarray()[:, [tfidf_index.vocabulary[w] for w in sorted(tfidf_index.vocabulary)]]
+
+
+class TestTfidfIndex:
+    def test_doc_matrix_equals_tfidf_vectorizer_one(self):
+        tfidf_index = TfidfIndex.create(TEXTS, UUIDS)
+        vectorizer = TfidfVectorizer()
+
+        expected = vectorizer.fit_transform(TEXTS).toarray()
+
+        nstools.assert_equals(tfidf_index.vocabulary, vectorizer.vocabulary_)
+        np.testing.assert_allclose(tfidf_index.doc_matrix.toarray(), expected, atol=1e-12)
+        np.testing.assert_allclose(tfidf_index.transform(['turnover of exports']).toarray(),
+                                   vectorizer.transform(['turnover of exports']).toarray(), atol=1e-12)
+
+    def test_update_equals_create_on_resulting_texts(self):
+        added_texts = ['export turnover', 'new word', '']
+        added_uuids = ['g', 'h', 'i']
+
+        updated = TfidfIndex.create(TEXTS, UUIDS).update(['b', 'c'], added_texts, added_uuids)
+        created = TfidfIndex.create([TEXTS[0]] + TEXTS[3:] + added_texts, ['a', 'd', 'e', 'f'] + added_uuids)
+
+        nstools.assert_list_equal(sorted(updated.vocabulary), sorted(created.vocabulary))
+        nstools.assert_list_equal(list(updated.uuids), list(created.uuids))
+        np.testing.assert_allclose(_by_words(updated, updated.doc_matrix), _by_words(created, created.doc_matrix),
+                                   atol=1e-12)
+
+        text = ['valu of new export']
+        np.testing.assert_allclose(_by_words(updated, updated.transform(text)),
+                                   _by_words(created, created.transform(text)), atol=1e-12)
@@ -0,0 +1,25 @@
+import nose.tools as nstools
+import numpy as np
+
+from qsim.word_vectors import WordVectors
+
+
+class TestWordVectors:
+    WV_DICT = {
+        'turnover': np.array([1.0, 2.0]),
+        'vat': np.array([3.0, 4.0]),
+    }
+
+    def test_dict_like_access(self):
+        wv = WordVectors.from_dict(self.WV_DICT)
+
+        nstools.assert_true('vat' in wv)
+        nstools.assert_false('value' in wv)
+        nstools.assert_equals(len(wv), 2)
+        np.testing.assert_array_equal(wv['vat'], [3.0, 4.0])
+
+    def test_get_vectors(self):
+        wv = WordVectors.from_dict(self.WV_DICT)
+
+        np.testing.assert_array_equal(wv.get_vectors(['vat', 'turnover', 'vat']), [[3, 4], [1, 2], [3, 4]])
+        nstools.assert_equals(wv.get_vectors([]).shape, (0, 2))